@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+Compare encode and decode time and stored size for each available
+cache codec and compression, using a synthetic rank result.
+"""
+
+import sys
+import random
+import timeit
+import argparse
+
+from caatdash.web.codec import CODECS, COMPRESSIONS, CacheCodec
+
+
+
+def rank_result(n_items, label_length, seed=0):
+    rng = random.Random(seed)
+    words = ["arms", "export", "licence", "military", "equipment",
+             "components", "aircraft", "vehicles", "software", "technology"]
+
+    def label():
+        text = []
+        while len(" ".join(text)) < label_length:
+            text.append(rng.choice(words))
+        return " ".join(text)
+
+    return {
+        "index": "value",
+        "items": [
+            {
+                "key": f"item-{i}",
+                "label": label(),
+                "value": rng.randint(0, 10 ** 9),
+                "count": rng.randint(0, 1000),
+            } for i in range(n_items)
+        ],
+    }
+
+
+
+def bench(value, codec, compression, threshold, number):
+    cache_codec = CacheCodec(codec, compression=compression, threshold=threshold)
+    data = cache_codec.encode(value)
+
+    encode = timeit.timeit(lambda: cache_codec.encode(value), number=number) / number
+    decode = timeit.timeit(lambda: CacheCodec.decode(data), number=number) / number
+
+    return {
+        "name": codec + (f"+{compression}" if compression else ""),
+        "bytes": len(data),
+        "encode": encode,
+        "decode": decode,
+    }
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cache codecs.")
+    parser.add_argument(
+        "--items", "-n",
+        type=int, default=5000,
+        help="Number of rank items.")
+    parser.add_argument(
+        "--label-length", "-l",
+        type=int, default=80,
+        help="Approximate length of item labels.")
+    parser.add_argument(
+        "--threshold", "-t",
+        type=int, default=1024,
+        help="Compression threshold in bytes.")
+    parser.add_argument(
+        "--number", "-N",
+        type=int, default=20,
+        help="Repetitions per measurement.")
+
+    args = parser.parse_args()
+
+    value = rank_result(args.items, args.label_length)
+
+    baseline = CacheCodec("json").encode(value)
+    sys.stdout.write(
+        f"{args.items} items, label length {args.label_length}, "
+        f"baseline JSON {len(baseline)} bytes\n\n")
+    sys.stdout.write(f"{'codec':<16} {'bytes':>10} {'ratio':>7} "
+                     f"{'encode ms':>10} {'decode ms':>10}\n")
+
+    for codec in CODECS:
+        for compression in [None] + list(COMPRESSIONS):
+            result = bench(value, codec, compression, args.threshold, args.number)
+            sys.stdout.write(
+                f"{result['name']:<16} {result['bytes']:>10} "
+                f"{result['bytes'] / len(baseline):>7.3f} "
+                f"{result['encode'] * 1000:>10.3f} {result['decode'] * 1000:>10.3f}\n")
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+"""
+Compare the per-request cost of evaluating synthetic filters with the
+previous filter implementation, the current filters one at a time,
+and a compiled `FilterPlan`, for requests with and without filter
+query parameters.
+"""
+
+import re
+import sys
+import timeit
+import argparse
+import urllib.parse
+from copy import deepcopy
+
+from caatdash.web import FilterGroupedSet, FilterPartition, FilterPlan
+
+
+
+def set_values_previous(raw_params, key):
+    re_split_items = re.compile(r"(?:,)(?=[\w\"])")
+
+    values = set()
+    for instance_value in raw_params.get(key, []):
+        for v in re_split_items.split(instance_value):
+            v = urllib.parse.unquote_plus(v)
+            v = v.strip()
+            if not v:
+                continue
+            values.add(v)
+
+    return values or None
+
+
+
+class FilterGroupedSetPrevious(FilterGroupedSet):
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.items_full = set(self.items_full)
+
+    def request_args(self, raw_params, **_kwargs):
+        args = {}
+        redirect = False
+
+        args[self.key] = set_values_previous(raw_params, self.key)
+
+        if args[self.key] and self.items_full:
+            values = args[self.key]
+            if self.allow_search_text:
+                values, _search = self.values_exact_search(values)
+
+            values = set(values)
+            recognised = set(self.items_full)
+            assert not values - recognised
+
+        return (args, redirect)
+
+    def filter_dict(self, request_args, handler=None):
+        value_set = set()
+
+        for value in request_args[self.key] or []:
+            group = self.groups.get(value) if self.groups else None
+
+            if group:
+                value_set.update(group["items"])
+            elif self.null_value and value == self.null_value:
+                value_set.add(None)
+            else:
+                value_set.add(value)
+
+        return {self.key: value_set}, {}, []
+
+
+
+class FilterPartitionPrevious(FilterPartition):
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.all_value = set(self.all_value)
+        self.default_value = set(self.default_value)
+
+    @staticmethod
+    def partition_values(raw_params, key):
+        values = set()
+        for value in raw_params.get(key, []):
+            value = urllib.parse.unquote_plus(value)
+            for v in value.split(","):
+                v = v.strip()
+                if not v:
+                    continue
+                values.add(v)
+
+        return values or set()
+
+    def request_args(self, raw_params, default_all=None, **_kwargs):
+        values = self.partition_values(raw_params, self.key)
+
+        if "all" in values or default_all:
+            values = set()
+        elif not values:
+            if len(self.default_value) == len(self.all_value):
+                values = set()
+            else:
+                values = deepcopy(self.default_value)
+        else:
+            values = values & self.all_value
+
+        return ({self.key: values or None}, False)
+
+    def query_params(self, request_args):
+        value = request_args[self.key]
+
+        if value is None:
+            value = self.all_value
+
+        if value == self.default_value:
+            return []
+
+        if value == self.all_value:
+            value = ["all"]
+        else:
+            value = [v["key"] for v in self.items if v["key"] in value]
+
+        key = urllib.parse.quote_plus(str(self.key).encode("utf-8"))
+        value = ",".join(
+            [urllib.parse.quote_plus(str(v).encode("utf-8"))
+             for v in value if v])
+
+        return ["%s=%s" % (key, value)]
+
+
+
+def make_filters(n_items, n_groups, n_partition, previous=False):
+    grouped_set = FilterGroupedSetPrevious if previous else FilterGroupedSet
+    partition = FilterPartitionPrevious if previous else FilterPartition
+
+    items = [f"c{i:04d}" for i in range(n_items)]
+    groups = {
+        f"group-{g}": {
+            "items": items[g::n_groups],
+        } for g in range(n_groups)
+    }
+
+    filters = [
+        grouped_set({
+            "key": "country",
+            "items": items,
+            "groups": groups,
+        }),
+        grouped_set({
+            "key": "destination",
+            "items": items,
+            "groups": groups,
+        }),
+        partition({
+            "key": "rating",
+            "items": [
+                {"key": f"r{i}", "defaultValue": i % 3 != 0}
+                for i in range(n_partition)
+            ],
+        }),
+    ]
+
+    return {v.key: v for v in filters}
+
+
+
+def make_params(n_items, n_groups):
+    return {
+        "none": {},
+        "some": {
+            "country": [f"group-0,c{n_items - 1:04d},c0001"],
+        },
+        "all": {
+            "country": [f"group-0,c{n_items - 1:04d},c0001"],
+            "destination": [",".join([f"group-{g}" for g in range(n_groups)])],
+            "rating": ["r1,r2"],
+        },
+    }
+
+
+
+def evaluate_filters(filters, raw_params):
+    request_args = {}
+    filter_dict = {}
+    request_labels = {}
+    for filter_ in filters.values():
+        (args, _redirect) = filter_.request_args(raw_params)
+        request_args.update(args)
+        (filter_dict_, labels, _errors) = filter_.filter_dict(args)
+        filter_dict.update(filter_dict_)
+        request_labels.update(labels)
+
+    query_parts = []
+    for filter_ in filters.values():
+        query_parts += filter_.query_params(request_args)
+
+    return (filter_dict, query_parts)
+
+
+
+def evaluate_plan(plan, raw_params):
+    evaluation = plan.evaluate(raw_params)
+    query_parts = plan.query_params(evaluation.request_args)
+    return (evaluation.filter_dict, query_parts)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark filter evaluation.")
+    parser.add_argument(
+        "--items", "-n",
+        type=int, default=300,
+        help="Number of set filter items.")
+    parser.add_argument(
+        "--groups", "-g",
+        type=int, default=20,
+        help="Number of set filter groups.")
+    parser.add_argument(
+        "--partition", "-p",
+        type=int, default=12,
+        help="Number of partition filter items.")
+    parser.add_argument(
+        "--number", "-N",
+        type=int, default=2000,
+        help="Repetitions per measurement.")
+
+    args = parser.parse_args()
+
+    previous = make_filters(args.items, args.groups, args.partition, previous=True)
+    filters = make_filters(args.items, args.groups, args.partition)
+    plan = FilterPlan(filters)
+
+    sys.stdout.write(
+        f"{args.items} items, {args.groups} groups, "
+        f"{args.partition} partition items\n\n")
+    sys.stdout.write(f"{'params':<8} {'previous µs':>12} {'current µs':>12} {'plan µs':>12}\n")
+
+    for name, raw_params in make_params(args.items, args.groups).items():
+        assert evaluate_filters(previous, raw_params) == evaluate_filters(filters, raw_params)
+        assert evaluate_plan(plan, raw_params) == evaluate_filters(filters, raw_params)
+
+        durations = [
+            timeit.timeit(f, number=args.number) / args.number
+            for f in (
+                lambda: evaluate_filters(previous, raw_params),
+                lambda: evaluate_filters(filters, raw_params),
+                lambda: evaluate_plan(plan, raw_params),
+            )
+        ]
+
+        sys.stdout.write(f"{name:<8}" + "".join(
+            [f" {v * 1e6:>12.1f}" for v in durations]) + "\n")
+
+
+
+if __name__ == "__main__":
+    main()
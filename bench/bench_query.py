@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""
+Compare query string parsing by `BaseHandler.get_raw_params` against
+the previous implementation, for typical and pathological URLs.
+"""
+
+import re
+import sys
+import timeit
+import argparse
+import urllib.parse
+from collections import defaultdict
+
+import tornado.web
+
+from caatdash.web import BaseHandler, QUERY_PARAMS_MAX, QUERY_LENGTH_MAX
+
+
+
+def get_raw_params_previous(uri):
+    params = defaultdict(list)
+
+    query_string = urllib.parse.urlsplit(uri)[3]
+    parts = re.compile(r"[&;]").split(query_string)
+    for part in parts:
+        part = urllib.parse.unquote(part)
+        e = part.split("=", 1)
+        if len(e) == 2:
+            (key, value) = e
+        else:
+            (key, ) = e
+            value = None
+        key = urllib.parse.unquote_plus(key)
+        params[key].append(value)
+
+    return params
+
+
+
+URLS = {
+    "none": "/api/rank",
+    "typical": (
+        "/api/rank?country=france,germany,united-kingdom"
+        "&rating=ml1,ml2,ml3&date=2015-01..2020-12&lang=en"),
+    "encoded": (
+        "/api/rank?company=%22Acme+Arms%22,bae-systems"
+        "&search=%C3%A9l%C3%A9ments+de+d%C3%A9fense&lang=fr"),
+    "many": "/api/rank?" + "&".join([f"p{i}=v{i}" for i in range(10000)]),
+    "long": "/api/rank?country=" + ",".join(["x" * 8] * 20000),
+}
+
+
+
+def parse(uri, capped):
+    if not capped:
+        return BaseHandler.get_raw_params(uri)
+
+    try:
+        return BaseHandler.get_raw_params(
+            uri, max_params=QUERY_PARAMS_MAX, max_length=QUERY_LENGTH_MAX)
+    except tornado.web.HTTPError:
+        return None
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query string parsing.")
+    parser.add_argument(
+        "--number", "-N",
+        type=int, default=200,
+        help="Repetitions per measurement.")
+
+    args = parser.parse_args()
+
+    sys.stdout.write(f"{'url':<10} {'previous µs':>12} {'current µs':>12} {'capped µs':>12}\n")
+
+    for name, uri in URLS.items():
+        assert dict(get_raw_params_previous(uri)) == dict(parse(uri, False))
+
+        previous = timeit.timeit(
+            lambda: get_raw_params_previous(uri), number=args.number) / args.number
+        current = timeit.timeit(
+            lambda: parse(uri, False), number=args.number) / args.number
+        capped = timeit.timeit(
+            lambda: parse(uri, True), number=args.number) / args.number
+
+        sys.stdout.write(
+            f"{name:<10} {previous * 1e6:>12.1f} {current * 1e6:>12.1f} "
+            f"{capped * 1e6:>12.1f}\n")
+
+
+
+if __name__ == "__main__":
+    main()
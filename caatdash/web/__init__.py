@@ -1,27 +1,59 @@
 import re
 import sys
+import asyncio
+import inspect
 import json
+import time
 import gettext
+import threading
 import hashlib
+import contextlib
+import functools
+import importlib
 import urllib.parse
-from copy import deepcopy
 from typing import Union, List, Set, Tuple
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from types import MappingProxyType
 from collections import defaultdict, namedtuple
 
 import bleach
 import markdown
 import tornado.web
+import tornado.escape
+from tornado.ioloop import IOLoop
 from tornado.log import app_log
 
 from firma.web import \
     Application, \
     BaseHandler as FirmaBaseHandler
 
+from caatdash.web.cache import LocalCache, SingleFlight, AsyncSingleFlight
+from caatdash.web.codec import \
+    CacheCodec, \
+    RESPONSE_ENCODINGS, \
+    RESPONSE_DECODINGS, \
+    accept_encodings
+from caatdash.web.admission import AdmissionControl, AdmissionRejected
+from caatdash.web.autocomplete import \
+    AutocompleteIndex, \
+    AUTOCOMPLETE_LIMIT, \
+    AUTOCOMPLETE_LIMIT_MAX, \
+    AUTOCOMPLETE_MAX_AGE
+from caatdash.web.metrics import \
+    Metrics, \
+    MetricsHandler, \
+    TIME_BUCKETS, \
+    SIZE_BUCKETS
+
 
 
 CACHE_TTL_SHORT = 7 * 24 * 60 * 60    # One week
 CACHE_TTL_LONG = 30 * 24 * 60 * 60    # One month
+CACHE_LOCAL_TTL = 5 * 60               # Five minutes
+FILTER_SPEC_MAX_AGE = 365 * 24 * 60 * 60    # One year
+FILTER_PLANS_MAX = 64
+MASK_VALUES_MEMO_MAX = 256
 MARKDOWN_DEFAULT_TAGS = [
     "a",
     "p",
@@ -41,6 +73,20 @@ MARKDOWN_DEFAULT_ATTRIBUTES = [
 
 
 FilterSetItemGroup = namedtuple("FilterSetItemGroup", "value label items")
+FilterEvaluation = namedtuple(
+    "FilterEvaluation", "request_args filter_dict request_labels errors redirect")
+FilterAbsent = namedtuple(
+    "FilterAbsent",
+    "request_args filter_dict request_args_mutable filter_dict_mutable static_keys dynamic")
+
+# Result of a widget that did not finish within its timeout.
+WIDGET_PENDING = {"pending": True}
+# Result of a cached function with no time left to compute it.
+RESULT_PARTIAL = {"partial": True}
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_STREAM_MIN_VALUES = 20000
+QUERY_PARAMS_MAX = 256
+QUERY_LENGTH_MAX = 16 * 1024
 
 
 
@@ -108,13 +154,101 @@ def cache_join(items):
 
 
 
+def json_length(obj) -> int:
+    """
+    Return the number of values in `obj` and in the lists and dicts it
+    directly holds, as a cheap estimate of the size of its JSON encoding.
+    """
+
+    def length(value):
+        return len(value) if isinstance(value, (dict, list, tuple)) else 0
+
+    if isinstance(obj, dict):
+        values = obj.values()
+    elif isinstance(obj, (list, tuple)):
+        values = obj
+    else:
+        return 0
+
+    return len(values) + sum([length(v) for v in values])
+
+
+
+def canonical_value(value):
+    """
+    Convert `value` to a hashable form that is equal for equivalent values.
+
+    Sets become sorted tuples, empty collections become `None`.
+    """
+
+    if isinstance(value, (set, frozenset)):
+        if not value:
+            return None
+        return tuple(sorted(
+            [canonical_value(v) for v in value],
+            key=lambda v: (v is not None, repr(v))
+        ))
+
+    if isinstance(value, dict):
+        return canonical_filter_dict(None, value)
+
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return None
+        return tuple(canonical_value(v) for v in value)
+
+    return value
+
+
+
+def canonical_filter_dict(filters, filter_dict):
+    """
+    Return a hashable form of `filter_dict` that is equal for equivalent
+    filter states, using each filter's `canonical_value` where available.
+
+    Keys with no filtering effect are omitted.
+    """
+
+    items = []
+    for key, value in filter_dict.items():
+        filter_ = filters.get(key, None) if filters else None
+        value = filter_.canonical_value(value) if filter_ else canonical_value(value)
+        if value is None:
+            continue
+        items.append((key, value))
+
+    items.sort(key=lambda v: v[0])
+
+    return tuple(items)
+
+
+
+def fingerprint(value) -> str:
+    """
+    Return a short, stable hash of a canonical value.
+    """
+
+    return hashlib.blake2b(repr(value).encode(), digest_size=12).hexdigest()
+
+
+
 def post_limit_items(f):
+    decorator = getattr(f, "cache_and_profile", None)
+    if decorator and decorator.top_k:
+        # `f` applies the limit itself.
+        return f
+
+    # Copies `cache_and_profile`, used by `BaseHandler.cache_prefetch`.
+    @functools.wraps(f)
     def wrapper(_self, filter_dict, **kwargs):
         post_limit = kwargs.pop("post_limit", None)
         result = f(_self, filter_dict, **kwargs)
 
-        if result["items"] and post_limit is not None:
-            result["items"] = result["items"][:post_limit]
+        # Degraded results such as `RESULT_PARTIAL` have no items.
+        if result and result.get("items") and post_limit is not None:
+            # Copy rather than modify `result`, which may be shared
+            # with the in-process cache.
+            result = dict(result, items=result["items"][:post_limit])
 
         return result
 
@@ -122,6 +256,86 @@ def post_limit_items(f):
 
 
 
+def merge_sum(values):
+    """
+    Merge results computed for disjoint filter values by adding numbers.
+
+    Dicts are merged key by key, and lists of dicts are merged by the
+    value of their `key` field, in order of first appearance. `None` is
+    ignored, and other values are taken from the first result.
+
+    Raises `ValueError` for results that cannot be merged, such as
+    a number and a dict, or lists of items without `key` fields.
+    """
+
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+
+    first = values[0]
+
+    def require(condition, description):
+        if not condition:
+            raise ValueError(f"Cannot merge {description}.")
+
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        require(all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in values
+        ), "numbers with other values")
+        return sum(values)
+
+    if isinstance(first, dict):
+        require(all(isinstance(v, dict) for v in values), "dicts with other values")
+        keys = {}
+        for value in values:
+            keys.update(dict.fromkeys(value))
+        return {k: merge_sum([v.get(k, None) for v in values]) for k in keys}
+
+    if isinstance(first, list):
+        require(all(
+            isinstance(value, list)
+            and all(isinstance(v, dict) and "key" in v for v in value)
+            for value in values
+        ), "lists other than of dicts with `key` fields")
+        items = {}
+        for value in values:
+            for item in value:
+                items.setdefault(item["key"], []).append(item)
+        return [dict(merge_sum(v), key=k) for k, v in items.items()]
+
+    return first
+
+
+
+def merge_top_k(values):
+    """
+    As `merge_sum`, then sort `items` by the field named by `index`
+    (default `value`) in descending order, so that the first `limit`
+    items are the top items of the combined selection, and set `count`,
+    if present, to the number of distinct items.
+    """
+
+    result = merge_sum(values)
+
+    if result and result.get("items"):
+        index = result.get("index", None) or "value"
+        items = sorted(
+            result["items"], key=lambda v: v.get(index, None) or 0, reverse=True)
+        result = dict(result, items=items)
+        if "count" in result:
+            result["count"] = len(items)
+
+    return result
+
+
+
+MERGE_FUNCTIONS = {
+    "sum": merge_sum,
+    "top_k": merge_top_k,
+}
+
+
+
 # Format functions
 
 
@@ -287,284 +501,640 @@ def template2json(target, deps, static_path: Path):
 
 
 class cache_and_profile():  # pylint: disable=invalid-name
-    def __init__(self, key, hook=None):
-        self.key = key
-        self.hook = hook
+    """
+    `coalesce`:
+      Concurrent misses for the same cache key share a single call of the
+      wrapped function. See `CaatDashApplication.cache_coalesce`.
+    `stale`:
+      Return an expired value immediately if one is present and refresh it
+      in the background. Requires `CaatDashApplication.init_cache_refresh`,
+      and that the wrapped function may be called outside the IOLoop thread.
+    `top_k`:
+      The `post_limit` argument is passed to the wrapped function as `limit`,
+      so it need only compute the first `limit` of its `items`. The cache
+      records the largest limit computed, and serves any request for that
+      many items or fewer from it. Requests for more are computed again.
+    `depends`:
+      Keys of the filters that affect the result. Other filters are left
+      out of the cache key, so that their values share entries.
+    `sources`:
+      Names of the data sources the result depends on. The current
+      generation of each is part of the cache key, so that
+      `CaatDashApplication.cache_invalidate_source` invalidates
+      every entry depending on a source at once.
+    `budget`:
+      Seconds the wrapped function is expected to take. On a miss, if less
+      than this remains of the request's latency budget (see
+      `BaseHandler.budget_remaining`), an expired value is returned if
+      present, otherwise the result of `fallback`, otherwise a copy of
+      `RESULT_PARTIAL`. None of these are cached.
+    `fallback`:
+      Cheaper function with the same arguments as the wrapped function.
+    `decompose`:
+      Key of a set filter over whose values the result is decomposable.
+      A selection of several values is answered by caching the result for
+      each value separately, computing only those missing, and combining
+      them with `merge`. Values must select disjoint data. Not compatible
+      with `top_k`, as each result must be complete.
+    `merge`:
+      Name in `MERGE_FUNCTIONS`, or a function of a list of results
+      returning their combination. Defaults to `sum`.
+
+    Wrapped functions are listed in `cache_and_profile.registry`.
+    """
 
-    def __call__(self, f):
-        def wrapper(handler, filter_dict, **kwargs):
-            """\
-The cache returns `None` if no record is present, but we would like to
-be able to store values of `None`. We do not need to store values of `False`
-in the cache. So we'll let `False` in the cache stand for a value of `None`.
+    registry = []
 
--   Store a value of `None` as `False` in the cache.
--   Retrieve `False` in the cache as a value of `None`.
-"""
+    def __init__(
+            self, key, hook=None, coalesce=True, stale=False, top_k=False,
+            depends=None, sources=None, budget=None, fallback=None,
+            decompose=None, merge="sum"
+    ):
+        if decompose is not None:
+            assert not top_k
+            assert depends is None or decompose in depends
 
-            kwargs2 = deepcopy(kwargs)
-            kwargs2.pop("post_limit", None)
-            cache_key = handler.cache_key_filtered(
-                self.key, filter_dict, **kwargs2)
+        self.key = key
+        self.hook = hook
+        self.coalesce = coalesce
+        self.stale = stale
+        self.top_k = top_k
+        self.depends = set(depends) if depends is not None else None
+        self.sources = tuple(sorted(sources)) if sources else None
+        self.budget = budget
+        self.fallback = fallback
+        self.decompose = decompose
+        self.merge = MERGE_FUNCTIONS[merge] if isinstance(merge, str) else merge
 
-            if self.hook:
-                cache_key = self.hook(handler, filter_dict, cache_key)
 
-            if handler.get_argument_boolean("cache") is not False:
-                data = handler.cache_get_json(cache_key)
-                if data is not None:
-                    return None if data is False else data
+    def cache_key(self, handler, filter_dict, **kwargs):
+        if self.depends is not None:
+            filter_dict = {k: v for k, v in filter_dict.items() if k in self.depends}
 
-                if hasattr(handler, "request_cache_hook"):
-                    handler.request_cache_hook(True)
-            else:
-                if hasattr(handler, "request_cache_hook"):
-                    handler.request_cache_hook(False)
+        kwargs = {k: v for k, v in kwargs.items() if k != "post_limit"}
+        # Values are stored in a different format with `top_k`.
+        key = f"{self.key}:top-k" if self.top_k else self.key
+        cache_key = handler.cache_key_canonical(key, filter_dict, **kwargs)
 
-            handler.profile_start(self.key)
+        if self.sources:
+            cache_key += ":" + fingerprint(handler.cache_generations(self.sources))
 
-            data = f(handler, filter_dict, **kwargs)
+        if self.hook:
+            cache_key = self.hook(handler, filter_dict, cache_key)
 
-            handler.profile_end(self.key)
-            handler.cache_set_json(cache_key, False if data is None else data)
+        return cache_key
 
-            return data
 
-        return wrapper
+    @staticmethod
+    def limit_items(data, limit):
+        if data and data.get("items") and limit is not None and len(data["items"]) > limit:
+            return dict(data, items=data["items"][:limit])
+        return data
 
 
+    def pack(self, data, limit=None):
+        """
+        Return the value to store in the cache for `data`.
+        """
 
-class Filter:
-    def __init__(self, spec):
-        self.key = spec["key"]
-        self.text = spec.get("text", None)
-        self.codec_plus = spec.get("codecPlus", None)
+        if not self.top_k:
+            return False if data is None else data
 
-    def keys(self):
-        return set(self.default_request_args.keys())
+        if not (data and data.get("items")) or limit is None or len(data["items"]) < limit:
+            # All items have been computed, including when there are none.
+            limit = None
 
-    @property
-    def default_request_args(self):
         return {
-            self.key: None
+            "limit": limit,
+            "data": data,
         }
 
-    def filter_dict(self, request_args, handler=None):
-        filter_dict = {}
-        request_labels = {}
-        errors = []
 
-        filter_dict[self.key] = request_args[self.key]
+    def unpack(self, value, limit=None) -> Tuple[bool, object]:
+        """
+        Return `(found, data)` for a value from the cache.
+        """
 
-        return filter_dict, request_labels, errors
+        if value is None:
+            return (False, None)
 
+        if not self.top_k:
+            return (True, None if value is False else value)
 
-    def query_params(self, request_args) -> List[str]:
+        if value["limit"] is not None and (limit is None or limit > value["limit"]):
+            return (False, None)
+
+        return (True, self.limit_items(value["data"], limit))
+
+
+    def degrade(self, handler, cache_key, filter_dict, kwargs, limit, use_cache):
         """
-        Return URL-encoded query string value
+        Return a value without calling the wrapped function, and mark
+        the response as degraded so that it is not cached whole.
         """
 
-        value = request_args[self.key]
+        handler.response_degraded = True
 
-        if not value:
-            return []
+        if use_cache and not (self.stale and handler.cache_refresh_enabled):
+            (found, data) = self.unpack(
+                handler.cache_get_json(cache_key, accept_old=True), limit)
+            if found:
+                return data
 
-        key = urllib.parse.quote_plus(str(self.key).encode("utf-8"))
-        value = urllib.parse.quote_plus(str(value).encode("utf-8"))
+        if self.fallback:
+            if self.top_k:
+                kwargs = dict(kwargs, limit=limit)
+            return self.fallback(handler, filter_dict, **kwargs)
 
-        return ["%s=%s" % (key, value)]
+        return dict(RESULT_PARTIAL)
 
 
+    def refresh_limit(self, value, limit):
+        """
+        Return the limit for refreshing the cache value `value`, so that
+        it holds no fewer items than before.
+        """
 
-class FilterText(Filter):
-    def request_args(self, raw_params, **_kwargs) -> Tuple[dict, bool]:
-        args = {
-            self.key: None,
-        }
-        redirect = False
+        if not self.top_k or limit is None or value["limit"] is None:
+            return None if self.top_k else limit
 
-        value = raw_params.get(self.key, None)
-        if value:
-            # `value` is a list. Accept only the last supplied value.
-            value = value[-1]
+        return max(limit, value["limit"])
 
-            if value and self.codec_plus:
-                value = value.replace("+", " ")
-            value.strip() or None
 
-            if value:
-                args[self.key] = value
+    def count(self, handler, result):
+        handler.metrics.inc(
+            "caatdash_cache_requests_total", key=self.key, result=result)
 
-        return (args, redirect)
 
+    def call_kwargs(self, kwargs, limit):
+        """
+        Return the keyword arguments for the wrapped function.
+        """
 
+        return dict(kwargs, limit=limit) if self.top_k else kwargs
 
 
-class FilterBoolean(Filter):
-    def request_args(self, raw_params, **_kwargs) -> Tuple[dict, bool]:
-        args = {
-            self.key: None,
-        }
-        redirect = False
+    def store(self, handler, cache_key, data, limit):
+        """
+        Store `data` computed for `limit` items and return the cache value.
+        """
 
-        value = raw_params.get(self.key, None)
-        if value:
-            # `value` is a list. Accept only the last supplied value.
-            value = value[-1]
+        value = self.pack(data, limit)
+        handler.cache_set_json(cache_key, value, prefix=self.key)
+        return value
 
-            if value in ("0", "false"):
-                args[self.key] = False
-            elif value in ("1", "true"):
-                args[self.key] = True
 
-        return (args, redirect)
+    def lookup(self, handler, cache_key, limit, use_cache, refresh_call):
+        """
+        Return `(found, data)` from the cache for `cache_key`, and record
+        the result in metrics.
 
+        Blocks on cache access. `refresh_call` is a blocking function of
+        a limit, returning freshly computed data, used to refresh a stale
+        value in the background.
+        """
 
+        if not use_cache:
+            self.count(handler, "bypass")
+            if hasattr(handler, "request_cache_hook"):
+                handler.request_cache_hook(False)
+            return (False, None)
 
+        (found, data) = self.unpack(handler.cache_get_request(cache_key), limit)
+        if found:
+            self.count(handler, "hit")
+            return (True, data)
 
-class FilterGroupedSet(Filter):
-    re_search_text = re.compile('^\"(.*)\"$')
+        if self.stale and handler.cache_refresh_enabled:
+            value = handler.cache_get_json(cache_key, accept_old=True)
+            (found, data) = self.unpack(value, limit)
+            if found:
+                refresh_limit = self.refresh_limit(value, limit)
 
-    def __init__(self, spec):
-        super().__init__(spec)
+                def refresh():
+                    return self.store(
+                        handler, cache_key, refresh_call(refresh_limit), refresh_limit)
 
-        self.items = spec.get("items", None)
-        self.groups = spec.get("groups", None)
-        self.groups_expand = spec.get("groups_expand", None)
-        self.groups_extra_keys = spec.get("groups_extra_keys", None)
-        self.allow_search_text = spec.get("allowSearchText", None)
-        self.null_value = spec.get("nullValue", None)
-        self.extra = spec.get("extra", None)
+                self.count(handler, "stale")
+                handler.cache_refresh(cache_key, refresh)
+                return (True, data)
 
-        self.items_full = set()
-        if self.items:
-            if None in self.items:
-                app_log.error("`None` in `FilterGroupedSet.items` (`%s`).", self.key)
-                app_log.error(repr(self.items))
-            self.items_full.update(self.items)
+        self.count(handler, "miss")
+        if hasattr(handler, "request_cache_hook"):
+            handler.request_cache_hook(True)
 
-        if self.groups:
-            assert not self.items_full & set(self.groups)
-            if None in self.groups:
-                app_log.error("`None` in `FilterGroupedSet.groups` (`%s`).", self.key)
-                app_log.error(repr(self.groups))
-            self.items_full.update(self.groups)
+        return (False, None)
 
-        if self.groups_extra_keys:
-            assert not self.items_full & self.groups_extra_keys
-            if None in self.groups_extra_keys:
-                app_log.error("`None` in `FilterGroupedSet.groups_extra_keys` (`%s`).", self.key)
-                app_log.error(repr(self.groups_extra_keys))
-            self.items_full.update(self.groups_extra_keys)
 
-        if self.null_value:
-            assert self.null_value not in self.items_full
-            if self.null_value is None:
-                app_log.error("`FilterGroupedSet.null_value` is `None` (`%s`).", self.key)
-                app_log.error(repr(self.null_value))
-            self.items_full.add(self.null_value)
+    def atoms(self, handler, filter_dict, kwargs) -> dict:
+        """
+        Return a dict of cache keys and filter dicts for each value of the
+        `decompose` filter, or `None` if `filter_dict` is not decomposed.
+        """
 
-        if "placeholderNames" in spec and self.items:
-            placeholder_name_set = spec["placeholderNames"]
-            option_name_set = set([v["name"] for v in self.items["items"]])
-            not_found = placeholder_name_set - option_name_set
-            if not_found:
-                raise Exception(
-                    "Placeholder names %s not found in `%s` item names.",
-                    ", ".join([f"`{v}`" for v in not_found]),
-                    spec["key"]
-                )
+        values = filter_dict.get(self.decompose, None) if self.decompose else None
+        if not values or len(values) < 2:
+            return None
 
-        self.preverify = spec.get("preverify", None)
+        atom_filter_dicts = {}
+        for value in sorted(values, key=lambda v: (v is not None, repr(v))):
+            atom_filter_dict = dict(filter_dict)
+            atom_filter_dict[self.decompose] = {value}
+            atom_key = self.cache_key(handler, atom_filter_dict, **kwargs)
+            atom_filter_dicts[atom_key] = atom_filter_dict
 
+        return atom_filter_dicts
 
-    @staticmethod
-    def verify_set_values(key, values, recognised):
-        if not (values and recognised):
-            return
 
-        values = set(values)
-        recognised = set(recognised)
+    def lookup_atoms(self, handler, atom_filter_dicts) -> Tuple[dict, list]:
+        """
+        Return the cache values found for `atom_filter_dicts`, and a list
+        of the keys not found, recording the result in metrics.
+        """
 
-        unrecognised = values - recognised
-        if unrecognised:
-            raise FilterValueException(
-                f"Unrecognised values for filter `{key}`: `{repr(unrecognised)}`")
+        values = handler.cache_get_many(atom_filter_dicts)
+        missing = [v for v in atom_filter_dicts if v not in values]
 
+        if not missing:
+            self.count(handler, "hit")
+        else:
+            self.count(handler, "miss")
+            if hasattr(handler, "request_cache_hook"):
+                handler.request_cache_hook(True)
 
-    @staticmethod
-    def values_exact_search(
-            values: Set[str]
-    ) -> Tuple[Set[str], Set[str]]:
+        return (values, missing)
 
-        exact = set()
-        search = set()
 
-        for value in values:
-            if match := FilterGroupedSet.re_search_text.match(value):
-                search.add(match.group(1))
-            else:
-                exact.add(value)
+    def merge_atoms(self, atom_filter_dicts, values):
+        return self.merge([self.unpack(values[v])[1] for v in atom_filter_dicts])
 
-        return (exact, search)
 
+    def __call__(self, f):
+        def call(handler, filter_dict, kwargs, limit):
+            with handler.admit(self.key):
+                start = time.monotonic()
+                data = f(handler, filter_dict, **self.call_kwargs(kwargs, limit))
 
-    def request_args(self, raw_params, **_kwargs) -> Tuple[dict, bool]:
-        args = {}
-        redirect = False
+            handler.metrics.observe(
+                "caatdash_compute_seconds", time.monotonic() - start, key=self.key)
 
-        args[self.key] = BaseHandler.set_values(raw_params, self.key)
+            return data
 
-        if self.preverify:
-            preverify_redirect = self.preverify(args, raw_params)
-            redirect |= preverify_redirect
 
-        if args[self.key] and self.items_full:
-            values = args[self.key]
-            if self.allow_search_text:
-                values, _search = self.values_exact_search(values)
+        def compute(handler, cache_key, filter_dict, kwargs, limit):
+            handler.profile_start(self.key)
+            data = call(handler, filter_dict, kwargs, limit)
+            handler.profile_end(self.key)
 
-            self.verify_set_values(self.key, values, self.items_full)
+            return self.store(handler, cache_key, data, limit)
 
-        return (args, redirect)
 
+        def coalesce(handler, cache_key, filter_dict, kwargs, limit):
+            compute_key = functools.partial(
+                compute, handler, cache_key, filter_dict, kwargs, limit)
+            if self.coalesce:
+                return handler.cache_coalesce(cache_key, compute_key)
+            return compute_key()
 
-    def filter_dict(self, request_args, handler=None):
-        filter_dict = {}
-        request_labels = {}
-        errors = []
 
-        value_set = set()
-        label_set = set()
+        def decomposed(handler, filter_dict, kwargs, atom_filter_dicts):
+            """
+            Return the merged results for each value of the `decompose`
+            filter, computing only those not in the cache.
+            """
 
-        for value in request_args[self.key] or []:
-            group = None
+            (values, missing) = self.lookup_atoms(handler, atom_filter_dicts)
 
-            if self.groups_expand:
-                group = self.groups_expand(value, handler)
-            if group is None and self.groups:
-                group = self.groups.get(value)
+            if missing and handler.budget_exhausted(self.budget):
+                self.count(handler, "degraded")
+                cache_key = self.cache_key(handler, filter_dict, **kwargs)
+                return self.degrade(handler, cache_key, filter_dict, kwargs, None, True)
 
-            if group:
-                value_set.update(group["items"])
-                title = group.get("title", None)
-                if title:
-                    if callable(title):
-                        title = title(handler.i18n)
-                    label_set.add(FilterSetItemGroup(value, title, tuple(group["items"])))
-            elif self.null_value and value == self.null_value:
-                value_set.add(None)
-            else:
-                value_set.add(value)
+            for atom_key in missing:
+                values[atom_key] = coalesce(
+                    handler, atom_key, atom_filter_dicts[atom_key], kwargs, None)
 
-        filter_dict[self.key] = value_set
+            return self.merge_atoms(atom_filter_dicts, values)
 
-        if label_set:
-            request_labels[self.key] = label_set
+
+        def wrapper(handler, filter_dict, **kwargs):
+            """\
+The cache returns `None` if no record is present, but we would like to
+be able to store values of `None`. We do not need to store values of `False`
+in the cache. So we'll let `False` in the cache stand for a value of `None`.
+
+-   Store a value of `None` as `False` in the cache.
+-   Retrieve `False` in the cache as a value of `None`.
+"""
+
+            limit = kwargs.pop("post_limit", None) if self.top_k else None
+
+            use_cache = handler.get_argument_boolean("cache") is not False
+
+            if use_cache:
+                atom_filter_dicts = self.atoms(handler, filter_dict, kwargs)
+                if atom_filter_dicts:
+                    return decomposed(handler, filter_dict, kwargs, atom_filter_dicts)
+
+            cache_key = self.cache_key(handler, filter_dict, **kwargs)
+
+            (found, data) = self.lookup(
+                handler, cache_key, limit, use_cache,
+                lambda limit: call(handler, filter_dict, kwargs, limit))
+            if found:
+                return data
+
+            if handler.budget_exhausted(self.budget):
+                self.count(handler, "degraded")
+                return self.degrade(handler, cache_key, filter_dict, kwargs, limit, use_cache)
+
+            if use_cache:
+                # Another caller may have computed fewer items than required.
+                (found, data) = self.unpack(
+                    coalesce(handler, cache_key, filter_dict, kwargs, limit), limit)
+                if found:
+                    return data
+
+            return self.unpack(compute(handler, cache_key, filter_dict, kwargs, limit), limit)[1]
+
+        wrapper.cache_and_profile = self
+        self.registry.append(wrapper)
+
+        return wrapper
+
+
+
+class cache_response():  # pylint: disable=invalid-name
+    """
+    Cache the whole response of a handler's `get` method, keyed on the
+    canonical URL of the request, so that requests differing only in
+    parameter order, encoding or default values share a response.
+
+    Only successful responses without a `Content-Encoding` are stored,
+    and not those degraded by the latency budget or widget timeouts.
+    The `stored_headers`, such as an `ETag` set by
+    `BaseHandler.check_etag_canonical`, are stored with the body and
+    replayed, and a stored `ETag` is checked against `If-None-Match`.
+    Bypassed if the `cache=false` query parameter is set, or any of
+    `bypass_params`, which `query_rewrite` drops.
+    """
+
+    bypass_params = ("budget", "pretty")
+    stored_headers = ("Content-Type", "ETag", "Cache-Control", "Vary")
+
+    def __init__(self, valuable=False):
+        self.valuable = valuable
+
+    def __call__(self, f):
+        async def wrapper(handler, *args, **kwargs):
+            if handler.get_argument_boolean("cache") is False or any(
+                    v in handler.raw_params for v in self.bypass_params):
+                result = f(handler, *args, **kwargs)
+                if inspect.isawaitable(result):
+                    await result
+                return
+
+            key = handler.response_cache_key()
+            record = handler.application.cache_get_bytes(key)
+
+            if record is not None:
+                handler.metrics.inc("caatdash_response_cache_total", result="hit")
+                (head, body) = record.split(b"\n", 1)
+                headers = json.loads(head)
+                for name, value in headers.items():
+                    handler.set_header(name, value)
+                if "ETag" in headers and handler.check_etag_header():
+                    handler.set_status(304)
+                    return
+                handler.write(body)
+                return
+
+            handler.metrics.inc("caatdash_response_cache_total", result="miss")
+            handler.response_capture = []
+
+            try:
+                result = f(handler, *args, **kwargs)
+                if inspect.isawaitable(result):
+                    await result
+            finally:
+                capture = handler.response_capture
+                handler.response_capture = None
+
+            headers = handler._headers  # pylint: disable=protected-access
+            if handler.get_status() != 200 or "Content-Encoding" in headers \
+               or handler.response_degraded:
+                return
+
+            head = json.dumps({
+                k: headers[k] for k in self.stored_headers if k in headers
+            }).encode()
+            handler.application.cache_set_bytes(
+                key, head + b"\n" + b"".join(capture), valuable=self.valuable)
+
+        return wrapper
+
+
+
+COMPUTE_FUNCTIONS = {}
+
+
+
+def compute_function_name(f):
+    return f"{f.__module__}:{f.__qualname__}"
+
+
+
+def compute_registered(name, filter_dict, kwargs):
+    """
+    Call a function registered by `cache_and_profile_async` by name,
+    with a `handler` of `None`. Used to run functions in a process pool.
+    """
+
+    if name not in COMPUTE_FUNCTIONS:
+        # Decorating the function registers it.
+        importlib.import_module(name.split(":", 1)[0])
+
+    return COMPUTE_FUNCTIONS[name](None, filter_dict, **kwargs)
+
+
+
+class cache_and_profile_async(cache_and_profile):  # pylint: disable=invalid-name
+    """
+    As `cache_and_profile`, but the wrapper is a coroutine. Cache access
+    runs in the IOLoop's default executor, and the wrapped function in the
+    executor set by `CaatDashApplication.init_compute_executor`.
+
+    In a process pool the wrapped function is called with a `handler` of
+    `None`, and must be defined at module level.
+
+    With `decompose`, the results for values missing from the cache are
+    computed concurrently.
+    """
+
+    def __call__(self, f):
+        COMPUTE_FUNCTIONS[compute_function_name(f)] = f
+
+        async def call(handler, filter_dict, kwargs, limit):
+            async with handler.admit_async(self.key):
+                start = time.monotonic()
+                data = await handler.compute_async(
+                    f, handler, filter_dict, self.call_kwargs(kwargs, limit))
+            handler.metrics.observe(
+                "caatdash_compute_seconds", time.monotonic() - start, key=self.key)
+
+            return data
+
+
+        def refresh_call(handler, filter_dict, kwargs, limit):
+            with handler.admit(self.key):
+                return handler.compute_blocking(
+                    f, handler, filter_dict, self.call_kwargs(kwargs, limit))
+
+
+        async def compute(handler, cache_key, filter_dict, kwargs, limit):
+            handler.profile_start(self.key)
+            data = await call(handler, filter_dict, kwargs, limit)
+            handler.profile_end(self.key)
+
+            return await IOLoop.current().run_in_executor(
+                None, self.store, handler, cache_key, data, limit)
+
+
+        async def coalesce(handler, cache_key, filter_dict, kwargs, limit):
+            compute_key = functools.partial(
+                compute, handler, cache_key, filter_dict, kwargs, limit)
+            if self.coalesce:
+                return await handler.cache_coalesce_async(cache_key, compute_key)
+            return await compute_key()
+
+
+        async def decomposed(handler, filter_dict, kwargs, atom_filter_dicts):
+            run = IOLoop.current().run_in_executor
+
+            (values, missing) = await run(
+                None, self.lookup_atoms, handler, atom_filter_dicts)
+
+            if missing and handler.budget_exhausted(self.budget):
+                self.count(handler, "degraded")
+                cache_key = await run(
+                    None, functools.partial(self.cache_key, handler, filter_dict, **kwargs))
+                return await run(
+                    None, self.degrade, handler, cache_key, filter_dict, kwargs, None, True)
+
+            results = await asyncio.gather(*[
+                coalesce(handler, v, atom_filter_dicts[v], kwargs, None) for v in missing
+            ])
+            values.update(zip(missing, results))
+
+            return self.merge_atoms(atom_filter_dicts, values)
+
+
+        async def wrapper(handler, filter_dict, **kwargs):
+            """\
+See `cache_and_profile` for the use of `False` in the cache to stand for
+a value of `None`.
+"""
+
+            run = IOLoop.current().run_in_executor
+
+            limit = kwargs.pop("post_limit", None) if self.top_k else None
+
+            use_cache = handler.get_argument_boolean("cache") is not False
+
+            if use_cache:
+                atom_filter_dicts = await run(
+                    None, self.atoms, handler, filter_dict, kwargs)
+                if atom_filter_dicts:
+                    return await decomposed(handler, filter_dict, kwargs, atom_filter_dicts)
+
+            cache_key = await run(
+                None, functools.partial(self.cache_key, handler, filter_dict, **kwargs))
+
+            (found, data) = await run(
+                None, self.lookup, handler, cache_key, limit, use_cache,
+                functools.partial(refresh_call, handler, filter_dict, kwargs))
+            if found:
+                return data
+
+            if handler.budget_exhausted(self.budget):
+                self.count(handler, "degraded")
+                return await run(None, self.degrade, handler, cache_key, filter_dict,
+                                 kwargs, limit, use_cache)
+
+            if use_cache:
+                # Another caller may have computed fewer items than required.
+                (found, data) = self.unpack(
+                    await coalesce(handler, cache_key, filter_dict, kwargs, limit), limit)
+                if found:
+                    return data
+
+            return self.unpack(
+                await compute(handler, cache_key, filter_dict, kwargs, limit), limit)[1]
+
+        wrapper.cache_and_profile = self
+        self.registry.append(wrapper)
+
+        return wrapper
+
+
+
+class Filter:
+    # Set if `request_args` reads only the `key` query parameter, and
+    # `filter_dict` and `query_params` only `key` in `request_args` and
+    # not `handler` when the parameter is absent, so that `FilterPlan`
+    # can evaluate the filter once for all requests without it.
+    # Not inherited, as subclasses may read other parameters or the
+    # handler: each class must set it itself.
+    default_static = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "default_static" not in vars(cls):
+            cls.default_static = False
+
+    def __init__(self, spec):
+        self.key = spec["key"]
+        self.text = spec.get("text", None)
+        self.codec_plus = spec.get("codecPlus", None)
+
+    def keys(self):
+        return set(self.default_request_args.keys())
+
+    @property
+    def default_request_args(self):
+        return {
+            self.key: None
+        }
+
+    def filter_dict(self, request_args, handler=None):
+        filter_dict = {}
+        request_labels = {}
+        errors = []
+
+        filter_dict[self.key] = request_args[self.key]
 
         return filter_dict, request_labels, errors
 
 
+    def spec_data(self, i18n=None) -> dict:
+        """
+        Return JSON-serializable data describing this filter to the client.
+        """
+
+        return {
+            "key": self.key,
+        }
+
+
+    def canonical_value(self, value):
+        """
+        Return a hashable form of this filter's `filter_dict` value
+        that is equal for equivalent values, or `None` if it has no effect.
+        """
+
+        return canonical_value(value)
+
+
     def query_params(self, request_args) -> List[str]:
         """
         Return URL-encoded query string value
@@ -576,147 +1146,1355 @@ class FilterGroupedSet(Filter):
             return []
 
         key = urllib.parse.quote_plus(str(self.key).encode("utf-8"))
-        value = ",".join(
-            [urllib.parse.quote_plus(str(v).encode("utf-8"))
-             for v in value])
+        value = urllib.parse.quote_plus(str(value).encode("utf-8"))
 
         return ["%s=%s" % (key, value)]
 
 
-class FilterPartition(Filter):
-    def __init__(self, spec):
-        super().__init__(spec)
 
-        self.items = spec["items"]
+class FilterText(Filter):
+    default_static = True
 
-        assert "all" not in self.items
+    def request_args(self, raw_params, **_kwargs) -> Tuple[dict, bool]:
+        args = {
+            self.key: None,
+        }
+        redirect = False
 
-        self.all_value = {v["key"] for v in self.items}
-        self.default_value = {v["key"] for v in self.items if v["defaultValue"]}
+        value = raw_params.get(self.key, None)
+        if value:
+            # `value` is a list. Accept only the last supplied value.
+            value = value[-1]
 
+            if value and self.codec_plus:
+                value = value.replace("+", " ")
+            value.strip() or None
 
-    @staticmethod
-    def partition_values(raw_params, key):
-        values = set()
-        for value in raw_params.get(key, []):
-            value = urllib.parse.unquote_plus(value)
-            for v in value.split(","):
-                v = v.strip()
-                if not v:
-                    continue
-                values.add(v)
+            if value:
+                args[self.key] = value
 
-        return values or set()
+        return (args, redirect)
 
 
-    @property
-    def default_request_args(self):
-        return {
-            self.key: self.default_value
-        }
 
 
-    def request_args(self, raw_params, default_all=None, **_kwargs) -> Tuple[dict, bool]:
-        args = {}
+class FilterBoolean(Filter):
+    default_static = True
+
+    def request_args(self, raw_params, **_kwargs) -> Tuple[dict, bool]:
+        args = {
+            self.key: None,
+        }
         redirect = False
 
-        if default_all is None:
-            default_all = False
+        value = raw_params.get(self.key, None)
+        if value:
+            # `value` is a list. Accept only the last supplied value.
+            value = value[-1]
 
-        values = self.partition_values(raw_params, self.key)
+            if value in ("0", "false"):
+                args[self.key] = False
+            elif value in ("1", "true"):
+                args[self.key] = True
 
-        if "all" in values:
-            values = set()
+        return (args, redirect)
 
-        elif not values:
-            if default_all:
-                values = set()
-            elif len(self.default_value) == len(self.all_value):
-                values = set()
-            else:
-                values = deepcopy(self.default_value)
-        else:
-            values = values & self.all_value
 
-        args[self.key] = values or None
 
-        return (args, redirect)
 
+class FilterGroupedSet(Filter):
+    default_static = True
 
-    def query_params(self, request_args) -> List[str]:
-        """
-        Convert `request_args` URL-encoded query string value
+    re_search_text = re.compile('^\"(.*)\"$')
 
-        For a partition, filtering is only applied if the `request_args` value
-        is truthy. So a `request_args` value of `None` is effectively the
-        `all_value` for the filter.
-        """
+    def __init__(self, spec):
+        super().__init__(spec)
 
-        value = request_args[self.key]
+        self.items = spec.get("items", None)
+        self.groups = spec.get("groups", None)
+        self.groups_expand = spec.get("groups_expand", None)
+        self.groups_extra_keys = spec.get("groups_extra_keys", None)
+        self.allow_search_text = spec.get("allowSearchText", None)
+        self.null_value = spec.get("nullValue", None)
+        self.extra = spec.get("extra", None)
+        self.item_label = spec.get("itemLabel", None)
+
+        self.items_full = set()
+        if self.items:
+            if None in self.items:
+                app_log.error("`None` in `FilterGroupedSet.items` (`%s`).", self.key)
+                app_log.error(repr(self.items))
+            self.items_full.update(self.items)
+
+        if self.groups:
+            assert not self.items_full & set(self.groups)
+            if None in self.groups:
+                app_log.error("`None` in `FilterGroupedSet.groups` (`%s`).", self.key)
+                app_log.error(repr(self.groups))
+            self.items_full.update(self.groups)
+
+        if self.groups_extra_keys:
+            assert not self.items_full & self.groups_extra_keys
+            if None in self.groups_extra_keys:
+                app_log.error("`None` in `FilterGroupedSet.groups_extra_keys` (`%s`).", self.key)
+                app_log.error(repr(self.groups_extra_keys))
+            self.items_full.update(self.groups_extra_keys)
+
+        if self.null_value:
+            assert self.null_value not in self.items_full
+            if self.null_value is None:
+                app_log.error("`FilterGroupedSet.null_value` is `None` (`%s`).", self.key)
+                app_log.error(repr(self.null_value))
+            self.items_full.add(self.null_value)
+
+        if "placeholderNames" in spec and self.items:
+            placeholder_name_set = spec["placeholderNames"]
+            option_name_set = set([v["name"] for v in self.items["items"]])
+            not_found = placeholder_name_set - option_name_set
+            if not_found:
+                raise Exception(
+                    "Placeholder names %s not found in `%s` item names.",
+                    ", ".join([f"`{v}`" for v in not_found]),
+                    spec["key"]
+                )
+
+        self.preverify = spec.get("preverify", None)
+        # `preverify` may read any query parameter.
+        self.default_static = type(self).default_static and not self.preverify
+
+        self.items_full = frozenset(self.items_full)
+
+        # Intern every known value as a bit, so that selections can be
+        # expanded, verified and compared as integer bitsets.
+
+        interned = set(self.items_full)
+        for group in (self.groups or {}).values():
+            interned.update(group["items"])
+        if self.null_value:
+            interned.add(None)
+
+        self.item_values = tuple(sorted(interned, key=lambda v: (v is None, str(v))))
+        self.item_bits = {v: 1 << i for i, v in enumerate(self.item_values)}
+        self.item_digest = fingerprint(self.item_values)
+        self.item_quoted = {
+            v: urllib.parse.quote_plus(str(v).encode("utf-8"))
+            for v in self.item_values if v is not None
+        }
+
+        self.items_mask = self.mask(self.items_full)[0]
+        self.group_masks = {
+            k: self.mask(v["items"])[0] for k, v in (self.groups or {}).items()
+        }
+
+        self.mask_values_memo = {}
+
+
+    def mask(self, values) -> Tuple[int, set]:
+        """
+        Return the bitset of interned `values`, and a set of the values
+        that are not interned.
+        """
+
+        mask = 0
+        unknown = set()
+        item_bits = self.item_bits
+        for value in values:
+            bit = item_bits.get(value, None)
+            if bit is None:
+                unknown.add(value)
+            else:
+                mask |= bit
+
+        return (mask, unknown)
+
+
+    def mask_values(self, mask: int) -> frozenset:
+        """
+        Return the values of the bits set in `mask`.
+
+        Memoized for the first `MASK_VALUES_MEMO_MAX` masks.
+        """
+
+        values = self.mask_values_memo.get(mask, None)
+        if values is not None:
+            return values
+
+        item_values = self.item_values
+        values = frozenset([
+            item_values[i]
+            for i, bit in enumerate(reversed(bin(mask)[2:]))
+            if bit == "1"
+        ])
+
+        if len(self.mask_values_memo) < MASK_VALUES_MEMO_MAX:
+            self.mask_values_memo[mask] = values
+
+        return values
+
+
+    @staticmethod
+    def verify_set_values(key, values, recognised):
+        if not (values and recognised):
+            return
+
+        if not isinstance(values, (set, frozenset)):
+            values = set(values)
+        if not isinstance(recognised, (set, frozenset)):
+            recognised = set(recognised)
+
+        unrecognised = values - recognised
+        if unrecognised:
+            raise FilterValueException(
+                f"Unrecognised values for filter `{key}`: `{repr(unrecognised)}`")
+
+
+    @staticmethod
+    def values_exact_search(
+            values: Set[str]
+    ) -> Tuple[Set[str], Set[str]]:
+
+        exact = set()
+        search = set()
+
+        for value in values:
+            if match := FilterGroupedSet.re_search_text.match(value):
+                search.add(match.group(1))
+            else:
+                exact.add(value)
+
+        return (exact, search)
+
+
+    def request_args(self, raw_params, **_kwargs) -> Tuple[dict, bool]:
+        args = {}
+        redirect = False
+
+        args[self.key] = BaseHandler.set_values(raw_params, self.key)
+
+        if self.preverify:
+            preverify_redirect = self.preverify(args, raw_params)
+            redirect |= preverify_redirect
+
+        if args[self.key] and self.items_full:
+            values = args[self.key]
+            if self.allow_search_text:
+                values, _search = self.values_exact_search(values)
+
+            (mask, unrecognised) = self.mask(values)
+            unrecognised |= self.mask_values(mask & ~self.items_mask)
+            if unrecognised:
+                raise FilterValueException(
+                    f"Unrecognised values for filter `{self.key}`: `{repr(unrecognised)}`")
+
+        return (args, redirect)
+
+
+    def filter_dict(self, request_args, handler=None):
+        filter_dict = {}
+        request_labels = {}
+        errors = []
+
+        mask = 0
+        value_set = set()
+        label_set = set()
+
+        for value in request_args[self.key] or []:
+            group = None
+
+            if self.groups_expand:
+                group = self.groups_expand(value, handler)
+            if group is None and self.groups:
+                group = self.groups.get(value)
+                if group:
+                    mask |= self.group_masks[value]
+            elif group:
+                value_set.update(group["items"])
+
+            if group:
+                title = group.get("title", None)
+                if title:
+                    if callable(title):
+                        title = title(handler.i18n)
+                    label_set.add(FilterSetItemGroup(value, title, tuple(group["items"])))
+            elif self.null_value and value == self.null_value:
+                mask |= self.item_bits[None]
+            elif value in self.item_bits:
+                mask |= self.item_bits[value]
+            else:
+                value_set.add(value)
+
+        if mask:
+            value_set |= self.mask_values(mask)
+
+        filter_dict[self.key] = value_set
+
+        if label_set:
+            request_labels[self.key] = label_set
+
+        return filter_dict, request_labels, errors
+
+
+    def autocomplete_entries(self, i18n=None) -> List[dict]:
+        """
+        Return values and labels of groups, then items, for autocompletion.
+
+        Group labels are their `title`. Item labels are given by the
+        `itemLabel` spec, a dictionary or a function of value and `i18n`,
+        and default to the value.
+        """
+
+        def label(text, value):
+            if callable(text):
+                text = text(i18n)
+            return value if text is None else text
+
+        entries = []
+
+        for value, group in (self.groups or {}).items():
+            entries.append({
+                "value": value,
+                "label": label(group.get("title", None), value),
+            })
+
+        for value in self.items or []:
+            if callable(self.item_label):
+                text = self.item_label(value, i18n)
+            elif self.item_label:
+                text = self.item_label.get(value, None)
+            else:
+                text = None
+            entries.append({
+                "value": value,
+                "label": label(text, value),
+            })
+
+        return entries
+
+
+    def spec_data(self, i18n=None) -> dict:
+        """
+        Item and group values (`slug`) and labels, as `autocomplete_entries`.
+        """
+
+        entries = [
+            {
+                "slug": v["value"],
+                "label": v["label"],
+            } for v in self.autocomplete_entries(i18n)
+        ]
+        n_groups = len(self.groups or {})
+
+        for entry, group in zip(entries, (self.groups or {}).values()):
+            entry["items"] = list(group["items"])
+
+        return prune(dict(super().spec_data(i18n), **{
+            "allowSearchText": self.allow_search_text,
+            "nullValue": self.null_value,
+            "groups": entries[:n_groups],
+            "items": entries[n_groups:],
+        }))
+
+
+    def canonical_value(self, value):
+        """
+        Interned values are represented by their bitset, qualified by
+        a digest of the interned values so that keys change with them.
+        """
+
+        if not value:
+            return None
+
+        (mask, unknown) = self.mask(value)
+        if unknown:
+            return canonical_value(value)
+
+        return (self.item_digest, mask)
+
+
+    def query_params(self, request_args) -> List[str]:
+        """
+        Return URL-encoded query string value
+        """
+
+        value = request_args[self.key]
+
+        if not value:
+            return []
+
+        key = urllib.parse.quote_plus(str(self.key).encode("utf-8"))
+        item_quoted = self.item_quoted
+        # Sort so that equal sets give equal URLs.
+        value = ",".join(
+            [item_quoted[v] if v in item_quoted
+             else urllib.parse.quote_plus(str(v).encode("utf-8"))
+             for v in sorted(value, key=str)])
+
+        return ["%s=%s" % (key, value)]
+
+
+class FilterPartition(Filter):
+    default_static = True
+
+    def __init__(self, spec):
+        super().__init__(spec)
+
+        self.items = spec["items"]
+
+        assert "all" not in self.items
+
+        self.all_value = frozenset(v["key"] for v in self.items)
+        self.default_value = frozenset(v["key"] for v in self.items if v["defaultValue"])
+
+        # Selections are held as bitmasks of items in item order.
+
+        self.item_keys = tuple(v["key"] for v in self.items)
+        self.item_bits = {v: 1 << i for i, v in enumerate(self.item_keys)}
+        self.item_digest = fingerprint(self.item_keys)
+
+        self.all_mask = self.mask(self.all_value)
+        self.default_mask = self.mask(self.default_value)
+
+        self.mask_values_memo = {}
+
+
+    def mask(self, values) -> int:
+        """
+        Return the bitmask of `values`, ignoring unrecognised values.
+        """
+
+        mask = 0
+        item_bits = self.item_bits
+        for value in values:
+            mask |= item_bits.get(value, 0)
+
+        return mask
+
+
+    def mask_values(self, mask: int) -> frozenset:
+        """
+        Return the item keys of the bits set in `mask`.
+
+        Results are shared between callers and must not be mutated.
+        Memoized for the first `MASK_VALUES_MEMO_MAX` masks.
+        """
+
+        values = self.mask_values_memo.get(mask, None)
+        if values is not None:
+            return values
+
+        values = frozenset([v for v in self.item_keys if mask & self.item_bits[v]])
+
+        if len(self.mask_values_memo) < MASK_VALUES_MEMO_MAX:
+            self.mask_values_memo[mask] = values
+
+        return values
+
+
+    @staticmethod
+    def partition_values(raw_params, key):
+        values = set()
+        for value in raw_params.get(key, []):
+            if "%" in value or "+" in value:
+                value = urllib.parse.unquote_plus(value)
+            for v in value.split(","):
+                v = v.strip()
+                if not v:
+                    continue
+                values.add(v)
+
+        return values or set()
+
+
+    @property
+    def default_request_args(self):
+        return {
+            self.key: self.default_value
+        }
+
+
+    def spec_data(self, i18n=None) -> dict:
+        """
+        Items, with callable fields evaluated with `i18n`.
+        """
+
+        return dict(super().spec_data(i18n), **{
+            "items": [
+                {k: v(i18n) if callable(v) else v for k, v in item.items()}
+                for item in self.items
+            ],
+        })
+
+
+    def canonical_value(self, value):
+        """
+        Selections are represented by their bitmask, qualified by a digest
+        of the items so that keys change with them. Selecting every item
+        is equivalent to no selection.
+        """
+
+        if not value:
+            return None
+
+        mask = self.mask(value)
+        if not mask or mask == self.all_mask:
+            return None
+
+        return (self.item_digest, mask)
+
+
+    def request_args(self, raw_params, default_all=None, **_kwargs) -> Tuple[dict, bool]:
+        args = {}
+        redirect = False
+
+        if default_all is None:
+            default_all = False
+
+        values = self.partition_values(raw_params, self.key)
+
+        if "all" in values:
+            mask = 0
+        elif not values:
+            if default_all or self.default_mask == self.all_mask:
+                mask = 0
+            else:
+                mask = self.default_mask
+        else:
+            mask = self.mask(values)
+
+        args[self.key] = self.mask_values(mask) if mask else None
+
+        return (args, redirect)
+
+
+    def query_params(self, request_args) -> List[str]:
+        """
+        Convert `request_args` URL-encoded query string value
+
+        For a partition, filtering is only applied if the `request_args` value
+        is truthy. So a `request_args` value of `None` is effectively the
+        `all_value` for the filter.
+        """
+
+        value = request_args[self.key]
+
+        mask = self.all_mask if value is None else self.mask(value)
+
+        if mask == self.default_mask:
+            return []
+
+        if mask == self.all_mask:
+            value = ["all"]
+        else:
+            # Use item order so that equal sets give equal URLs.
+            value = [v for v in self.item_keys if mask & self.item_bits[v]]
+
+        key = urllib.parse.quote_plus(str(self.key).encode("utf-8"))
+        value = ",".join(
+            [urllib.parse.quote_plus(str(v).encode("utf-8"))
+             for v in value if v])
+
+        return ["%s=%s" % (key, value)]
+
+
+
+class FilterPlan():
+    """
+    Filters compiled once, at startup, and evaluated for a request
+    in a single pass.
+
+    Filters with `default_static` set are evaluated once, for each set
+    of `request_args` keyword arguments, as if their query parameters
+    were absent, and the results merged. A request then starts from the
+    merged results, and only evaluates filters whose parameters it has
+    and those without `default_static`. If `precompute` is false, every
+    filter is evaluated for every request, for plans used only once.
+    """
+
+    def __init__(self, filters: dict, precompute=True):
+        self.filters = tuple(filters.values())
+        self.filter_map = MappingProxyType(dict(filters))
+        self.precompute = precompute
+
+        default_request_args = {}
+        for filter_ in self.filters:
+            default_request_args.update(filter_.default_request_args)
+        self.default_request_args = MappingProxyType(default_request_args)
+
+        self.keys = frozenset(default_request_args)
+
+        self.absent_results = {}
+        self.absent_query = {}
+        self.absent(())
+
+
+    def absent(self, kwargs_key: tuple) -> FilterAbsent:
+        """
+        Return the merged results of the `default_static` filters
+        for a request without their query parameters.
+
+        `kwargs_key`: sorted items of keyword arguments to `request_args`.
+        """
+
+        absent = self.absent_results.get(kwargs_key, None)
+        if absent is not None:
+            return absent
+
+        request_args = {}
+        filter_dict = {}
+        static_keys = set()
+        dynamic = []
+
+        for filter_ in self.filters:
+            if not (self.precompute and filter_.default_static):
+                dynamic.append(filter_)
+                continue
+
+            (args, redirect) = filter_.request_args({}, **dict(kwargs_key))
+            (filter_filter_dict, labels, errors) = filter_.filter_dict(args)
+
+            # Only results that evaluating the filter for a request with
+            # its parameter would entirely replace can be merged.
+            if redirect or labels or errors or \
+               set(args) != {filter_.key} or set(filter_filter_dict) != {filter_.key}:
+                dynamic.append(filter_)
+                continue
+
+            request_args.update(args)
+            filter_dict.update(filter_filter_dict)
+            static_keys.add(filter_.key)
+
+            if not kwargs_key:
+                self.absent_query[filter_.key] = (
+                    args[filter_.key], tuple(filter_.query_params(args)))
+
+        def mutable(data):
+            return tuple(k for k, v in data.items() if isinstance(v, (set, dict, list)))
+
+        absent = FilterAbsent(
+            MappingProxyType(request_args), MappingProxyType(filter_dict),
+            mutable(request_args), mutable(filter_dict),
+            frozenset(static_keys), tuple(dynamic))
+        self.absent_results[kwargs_key] = absent
+
+        return absent
+
+
+    def evaluate(self, raw_params, handler=None, **kwargs) -> FilterEvaluation:
+        """
+        Return the request args, filter dict, request labels and errors
+        of all filters, and whether a redirect is required.
+
+        `kwargs` are passed to each filter's `request_args`,
+        and must be hashable.
+        """
+
+        absent = self.absent(tuple(sorted(kwargs.items())) if kwargs else ())
+
+        # Precomputed values are shared between requests.
+        request_args = dict(absent.request_args)
+        for key in absent.request_args_mutable:
+            request_args[key] = request_args[key].copy()
+        filter_dict = dict(absent.filter_dict)
+        for key in absent.filter_dict_mutable:
+            filter_dict[key] = filter_dict[key].copy()
+
+        request_labels = {}
+        errors = []
+        redirect = False
+
+        if absent.static_keys.isdisjoint(raw_params):
+            filters = absent.dynamic
+        else:
+            filters = [
+                v for v in self.filters
+                if v.key in raw_params or v.key not in absent.static_keys
+            ]
+
+        for filter_ in filters:
+            (args, filter_redirect) = filter_.request_args(raw_params, **kwargs)
+            request_args.update(args)
+            redirect |= filter_redirect
+
+            (filter_filter_dict, filter_labels, filter_errors) = filter_.filter_dict(
+                args, handler=handler)
+            filter_dict.update(filter_filter_dict)
+            request_labels.update(filter_labels)
+            errors += filter_errors
+
+        return FilterEvaluation(request_args, filter_dict, request_labels, errors, redirect)
+
+
+    def query_params(self, request_args) -> List[str]:
+        """
+        Return the URL-encoded query string values of all filters,
+        reusing those precomputed for `default_static` filters whose
+        value is that of a request without their parameter.
+        """
+
+        query_parts = []
+        for filter_ in self.filters:
+            absent = self.absent_query.get(filter_.key, None)
+            if absent is not None and request_args[filter_.key] == absent[0]:
+                query_parts += absent[1]
+            else:
+                query_parts += filter_.query_params(request_args)
+        return query_parts
+
+
+
+class CaatDashApplication(Application):
+    def __init__(self, handlers, options, **settings):
+        self.cache = None
+        self.cache_local = None
+        self.cache_codec = None
+        self.cache_flight = SingleFlight()
+        self.cache_flight_async = AsyncSingleFlight()
+        self.cache_lock = None
+        self.cache_refresh_executor = None
+        self.cache_refresh_limit = None
+        self.cache_refresh_pending = set()
+        self.cache_refresh_lock = threading.Lock()
+
+        self.compute_executor = None
+        self.compute_process = False
+        self.admission = None
+
+        self.faq = None
+        self.faq_mtime = None
+
+        self.i18n = None
+        self.i18n_options = None
+
+        self.filters = {}
+        self.filter_plan = None
+        self.filter_plans = {}
+        self.autocomplete_indexes = {}
+        self.autocomplete_lock = threading.Lock()
+        self.filter_specs = {}
+        self.filter_spec_digests = {}
+
+        self.metrics = Metrics()
+        self.metrics.counter(
+            "caatdash_cache_requests_total",
+            "Calls of cached functions by key and result: "
+            "hit, stale, miss, bypass or degraded.")
+        self.metrics.histogram(
+            "caatdash_compute_seconds",
+            "Time spent computing values of cached functions, by key.",
+            TIME_BUCKETS)
+        self.metrics.counter(
+            "caatdash_response_cache_total",
+            "Requests to handlers with `cache_response`, by result: hit or miss.")
+        self.metrics.histogram(
+            "caatdash_cache_value_bytes",
+            "Size of values stored by cached functions, by key.",
+            SIZE_BUCKETS)
+
+        metrics_path = settings.get("metrics_path", None)
+        if metrics_path:
+            handlers = list(handlers) + [(metrics_path, MetricsHandler)]
+
+        autocomplete_path = settings.get("autocomplete_path", None)
+        if autocomplete_path:
+            handlers = list(handlers) + [(autocomplete_path, FilterAutocompleteHandler)]
+
+        filter_spec_path = settings.get("filter_spec_path", None)
+        if filter_spec_path:
+            handlers = list(handlers) + [
+                (filter_spec_path + r"/([0-9a-f]+)\.json", FilterSpecHandler)]
+
+        super().__init__(handlers, options, **settings)
+
+
+    # Cache & Serialization
+
+    def dump_json(self, obj, **kwargs):
+        kwargs = dict({
+            "indent": 2,
+            "separators": (", ", ": ")
+        }, **kwargs)
+        serializer = self.json_serializer if hasattr(self, "json_serializer") else None
+        s = json.dumps(obj, default=serializer, **kwargs)
+        return s
+
+
+    def dump_json_iter(self, obj, chunk_size=JSON_CHUNK_SIZE, **kwargs):
+        """
+        Yield the output of `dump_json` in chunks of at least `chunk_size`
+        characters, except the last, without building it all in memory.
+
+        Incremental encoding uses the pure-Python encoder instead of the C
+        accelerated one, and takes about three times as long as `dump_json`
+        on the calling thread, so only use it where the memory saved is
+        worth the CPU.
+        """
+
+        kwargs = dict({
+            "indent": 2,
+            "separators": (", ", ": ")
+        }, **kwargs)
+        serializer = self.json_serializer if hasattr(self, "json_serializer") else None
+        encoder = json.JSONEncoder(default=serializer, **kwargs)
+
+        buffer = []
+        size = 0
+        for text in encoder.iterencode(obj):
+            buffer.append(text)
+            size += len(text)
+            if size >= chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+
+        if buffer:
+            yield "".join(buffer)
+
+
+    def init_cache_local(self, max_bytes, ttl=CACHE_LOCAL_TTL):
+        """
+        Hold up to `max_bytes` of decoded values in process,
+        in front of the shared cache.
+
+        Values are held for at most `ttl` seconds, so that changes made
+        to the shared cache by other workers are seen within that time.
+        """
+
+        self.cache_local = LocalCache(max_bytes, max_ttl=ttl)
+
+
+    def init_cache_codec(self, codec="json", compression=None, threshold=1024):
+        """
+        Store cache values as tagged bytes using `caatdash.web.codec`.
+        Requires a shared cache that stores bytes.
+
+        Existing untagged JSON entries are still read.
+        """
+
+        serializer = self.json_serializer if hasattr(self, "json_serializer") else None
+        self.cache_codec = CacheCodec(
+            codec, compression=compression, threshold=threshold, default=serializer)
+
+
+    def cache_decode(self, value):
+        if self.cache_codec:
+            return CacheCodec.decode(value)
+        return json.loads(value)
+
+
+    def cache_encode(self, value):
+        if self.cache_codec:
+            return self.cache_codec.encode(value)
+        return self.dump_json(value, indent=None, separators=(",", ":"),)
+
+
+    def cache_get_json(self, key, accept_old=False):
+        if self.cache_local:
+            data = self.cache_local.get(key)
+            if data is not None:
+                return data
+
+        value = self.settings.cache.get_item(key, accept_old=accept_old)
+        data = value and self.cache_decode(value)
+
+        # The remaining TTL of the shared entry is unknown, so assume the
+        # shorter one. Entries that may be stale are not held locally.
+        if self.cache_local and data is not None and not accept_old:
+            self.cache_local.set(key, data, len(value), CACHE_TTL_SHORT)
+
+        return data
+
+
+    def cache_get_bytes(self, key):
+        """
+        Return bytes stored with `cache_set_bytes`, or `None`.
+        """
+
+        if self.cache_local:
+            value = self.cache_local.get(key)
+            if value is not None:
+                return value
+
+        value = self.settings.cache.get_item(key)
+
+        if self.cache_local and value is not None:
+            self.cache_local.set(key, value, len(value), CACHE_TTL_SHORT)
+
+        return value
+
+
+    def cache_set_bytes(self, key, value: bytes, valuable=False):
+        """
+        Store bytes as they are, without encoding.
+        Requires a shared cache that stores bytes.
+        """
+
+        ttl = CACHE_TTL_LONG if valuable else CACHE_TTL_SHORT
+        status = self.settings.cache.set_item(key, value, ttl=ttl)
+
+        if self.cache_local:
+            self.cache_local.set(key, value, len(value), ttl)
+
+        return status
+
+
+    def cache_get_many(self, keys, accept_old=False) -> dict:
+        """
+        Return a dict of the values found for `keys`, fetching all those not
+        held locally in a single call if the shared cache supports `get_many`.
+        """
+
+        result = {}
+        keys = list(keys)
+
+        if self.cache_local:
+            for key in keys:
+                data = self.cache_local.get(key)
+                if data is not None:
+                    result[key] = data
+            keys = [v for v in keys if v not in result]
+
+        if not keys:
+            return result
+
+        get_many = getattr(self.settings.cache, "get_many", None)
+        if get_many:
+            values = get_many(keys, accept_old=accept_old)
+        else:
+            values = [self.settings.cache.get_item(v, accept_old=accept_old) for v in keys]
+
+        for key, value in zip(keys, values):
+            if not value:
+                continue
+            data = self.cache_decode(value)
+            result[key] = data
+            if self.cache_local and not accept_old:
+                self.cache_local.set(key, data, len(value), CACHE_TTL_SHORT)
+
+        return result
+
+
+    def cache_set_many(self, items: dict, valuable=False, prefix=None):
+        """
+        Store each of `items`, a dict of keys and values, in a single call
+        if the shared cache supports `set_many`.
+        """
+
+        ttl = CACHE_TTL_LONG if valuable else CACHE_TTL_SHORT
+
+        items = {k: False if v is None else v for k, v in items.items()}
+        texts = {k: self.cache_encode(v) for k, v in items.items()}
+
+        set_many = getattr(self.settings.cache, "set_many", None)
+        if set_many:
+            status = set_many(texts, ttl=ttl)
+        else:
+            status = all([
+                self.settings.cache.set_item(k, v, ttl=ttl)
+                for k, v in texts.items()
+            ])
+
+        for key, text in texts.items():
+            if prefix:
+                self.metrics.observe("caatdash_cache_value_bytes", len(text), key=prefix)
+            if self.cache_local:
+                self.cache_local.set(key, items[key], len(text), ttl)
+
+        return status
+
+
+    @staticmethod
+    def cache_generation_key(source):
+        return f"generation:{source}"
+
+
+    def cache_get_generations(self, sources) -> dict:
+        """
+        Return a dict of the current generation of each of `sources`.
+
+        Generations are read from the shared cache directly, never from
+        the local tier, so that invalidation is seen by every worker.
+        """
+
+        sources = list(sources)
+        keys = [self.cache_generation_key(v) for v in sources]
+
+        get_many = getattr(self.settings.cache, "get_many", None)
+        if get_many:
+            values = get_many(keys)
+        else:
+            values = [self.settings.cache.get_item(v) for v in keys]
+
+        return {k: v or "0" for k, v in zip(sources, values)}
+
+
+    def cache_invalidate_source(self, source):
+        """
+        Start a new generation of `source`, so that cache entries depending
+        on it are no longer used.
+
+        Generations outlive the entries that refer to them, so an expired
+        generation cannot make old entries current again.
+        """
+
+        return self.settings.cache.set_item(
+            self.cache_generation_key(source), str(time.time_ns()), ttl=CACHE_TTL_LONG)
+
+
+    def cache_set_json(
+            self, key, value, valuable=False, expired=False, prefix=None):
+        """
+        `prefix`: If supplied, record the stored size in metrics under this key.
+        """
+
+        ttl = CACHE_TTL_LONG if valuable else CACHE_TTL_SHORT
+
+        if value is None:
+            value = False
+
+        text = self.cache_encode(value)
+        status = self.settings.cache.set_item(key, text, ttl=ttl, expired=expired)
+
+        if prefix:
+            self.metrics.observe("caatdash_cache_value_bytes", len(text), key=prefix)
+
+        if self.cache_local:
+            if expired:
+                self.cache_local.delete(key)
+            else:
+                self.cache_local.set(key, value, len(text), ttl)
+
+        return status
+
+
+    def init_cache_lock(self, ttl=60, poll=0.1, wait=2):
+        """
+        Coalesce cache misses across workers as well as within them.
+
+        Requires the shared cache to provide `add_item(key, value, ttl)`,
+        which sets a value only if the key is absent and returns truthy on
+        success, and `delete_item(key)`.
+
+        `ttl`: Seconds before an abandoned lock expires. Also the longest
+          time another worker will wait for the result before computing it
+          itself, when waiting outside the IOLoop thread.
+        `poll`: Seconds between checks for the result while waiting.
+        `wait`: Longest time to wait for the result in the synchronous
+          `cache_compute_locked`, which blocks the IOLoop while it waits.
+        """
+
+        for name in ("add_item", "delete_item"):
+            if not hasattr(self.settings.cache, name):
+                raise Exception(
+                    f"Cache backend does not support `{name}`, required for locking.")
+
+        self.cache_lock = {
+            "ttl": ttl,
+            "poll": poll,
+            "wait": min(wait, ttl),
+        }
+
+
+    def cache_coalesce(self, key, compute):
+        """
+        Call `compute` to produce, store and return the cache value for
+        `key`, unless another caller is already doing so, in which case
+        wait for and return its result instead.
+        """
+
+        return self.cache_flight.do(key, lambda: self.cache_compute_locked(key, compute))
+
+
+    async def cache_coalesce_async(self, key, compute):
+        """
+        As `cache_coalesce`, where `compute` is a coroutine function.
+        """
+
+        return await self.cache_flight_async.do(
+            key, lambda: self.cache_compute_locked_async(key, compute))
+
+
+    def cache_lock_acquire(self, key):
+        return self.settings.cache.add_item(
+            f"lock:{key}", "1", ttl=self.cache_lock["ttl"])
+
+
+    def cache_lock_release(self, key):
+        self.settings.cache.delete_item(f"lock:{key}")
+
+
+    def cache_lock_wait(self, key, timeout):
+        """
+        Wait for up to `timeout` seconds for another worker holding the
+        lock on `key` to store its value. Return the value, or `None` if
+        it is not stored in time.
+        """
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.cache_lock["poll"])
+            value = self.cache_get_json(key)
+            if value is not None:
+                return value
+
+        app_log.warning("Timed out waiting for lock on `%s`.", key)
+        return None
+
+
+    def cache_compute_locked(self, key, compute):
+        if not self.cache_lock:
+            return compute()
+
+        if self.cache_lock_acquire(key):
+            try:
+                return compute()
+            finally:
+                self.cache_lock_release(key)
+
+        # Waiting blocks the IOLoop, so only wait briefly before computing.
+        value = self.cache_lock_wait(key, self.cache_lock["wait"])
+        if value is not None:
+            return value
+
+        return compute()
+
+
+    async def cache_compute_locked_async(self, key, compute):
+        if not self.cache_lock:
+            return await compute()
+
+        run = IOLoop.current().run_in_executor
+
+        if await run(None, self.cache_lock_acquire, key):
+            try:
+                return await compute()
+            finally:
+                await run(None, self.cache_lock_release, key)
+
+        value = await run(None, self.cache_lock_wait, key, self.cache_lock["ttl"])
+        if value is not None:
+            return value
+
+        return await compute()
+
+
+    # Computation
+
+    def init_compute_executor(self, max_workers=None, process=False):
+        """
+        Run functions wrapped by `cache_and_profile_async` in a pool of
+        `max_workers` threads, or processes if `process` is truthy.
+        Otherwise the IOLoop's default executor is used.
+        """
+
+        if process:
+            self.compute_executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.compute_executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="compute")
+        self.compute_process = bool(process)
+
+
+    def init_admission(self, limit=None, limits=None, key_limit=None, wait=1.0, retry_after=5):
+        """
+        Limit concurrent computations on cache misses, in total and by
+        `cache_and_profile` key. Cache hits are never limited.
+        See `caatdash.web.admission.AdmissionControl`.
+        """
+
+        self.admission = AdmissionControl(
+            limit=limit, limits=limits, key_limit=key_limit,
+            wait=wait, retry_after=retry_after, metrics=self.metrics)
+
+
+    def admit(self, key):
+        if self.admission is None:
+            return contextlib.nullcontext()
+        return self.admission.admit(key)
+
+
+    @contextlib.asynccontextmanager
+    async def admit_async(self, key):
+        if self.admission is None:
+            yield
+            return
+
+        async with self.admission.admit_async(key):
+            yield
+
+
+    async def compute_async(self, f, handler, filter_dict, kwargs):
+        run = IOLoop.current().run_in_executor
+
+        if self.compute_process:
+            return await run(
+                self.compute_executor, compute_registered,
+                compute_function_name(f), filter_dict, kwargs)
+
+        return await run(
+            self.compute_executor, functools.partial(f, handler, filter_dict, **kwargs))
+
+
+    def compute_blocking(self, f, handler, filter_dict, kwargs):
+        """
+        As `compute_async`, but block until the result is ready.
+        For use outside the IOLoop thread.
+        """
+
+        if self.compute_process:
+            return self.compute_executor.submit(
+                compute_registered, compute_function_name(f), filter_dict, kwargs).result()
+
+        return f(handler, filter_dict, **kwargs)
+
+
+    def init_cache_refresh(self, max_workers=4):
+        """
+        Allow stale values to be served while they are refreshed in the
+        background, with at most `max_workers` refreshes pending at once.
+        """
+
+        self.cache_refresh_executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="cache-refresh")
+        self.cache_refresh_limit = max_workers
+
+
+    @property
+    def cache_refresh_enabled(self):
+        return self.cache_refresh_executor is not None
+
+
+    def cache_refresh(self, key, compute):
+        """
+        Schedule `compute` to refresh the value for `key` in the background.
+
+        Returns `False` if a refresh of `key` is already pending or the
+        limit of pending refreshes has been reached, in which case nothing
+        is scheduled.
+        """
+
+        with self.cache_refresh_lock:
+            if key in self.cache_refresh_pending:
+                return False
+            if len(self.cache_refresh_pending) >= self.cache_refresh_limit:
+                return False
+            self.cache_refresh_pending.add(key)
+
+        def run():
+            try:
+                self.cache_coalesce(key, compute)
+            except Exception:  # pylint: disable=broad-except
+                app_log.exception("Failed to refresh cache for `%s`.", key)
+            finally:
+                with self.cache_refresh_lock:
+                    self.cache_refresh_pending.discard(key)
+
+        self.cache_refresh_executor.submit(run)
+        return True
+
+
+    # Filters
+
+    def compile_filters(self):
+        """
+        Build `filter_plan` and filter specs from `filters`.
+        Call once all filters are added and `init_i18n` has been called.
+        """
+
+        self.filter_plan = FilterPlan(self.filters)
+        self.filter_plans = {}
+        self.build_filter_specs()
 
-        if value is None:
-            value = self.all_value
 
-        if value == self.default_value:
-            return []
+    def filter_plan_for(self, filters: dict) -> Union[FilterPlan, None]:
+        """
+        Return `filter_plan` if `filters` are the application's filters,
+        otherwise a plan for `filters` compiled on first use, or `None`
+        if `compile_filters` has not been called.
+        """
 
+        if self.filter_plan is None:
+            return None
 
-        if value == self.all_value:
-            value = ["all"]
+        if filters == self.filter_plan.filter_map:
+            return self.filter_plan
 
-        key = urllib.parse.quote_plus(str(self.key).encode("utf-8"))
-        value = ",".join(
-            [urllib.parse.quote_plus(str(v).encode("utf-8"))
-             for v in value if v])
+        key = tuple(filters.items())
+        plan = self.filter_plans.get(key, None)
+        if plan is None:
+            plan = FilterPlan(filters)
+            if len(self.filter_plans) < FILTER_PLANS_MAX:
+                self.filter_plans[key] = plan
 
-        return ["%s=%s" % (key, value)]
+        return plan
 
 
+    def build_filter_specs(self):
+        """
+        Encode the `spec_data` of all filters as JSON for each language,
+        and compress it with each response content coding, to be served
+        by `FilterSpecHandler` at a URL containing a hash of the content.
+        """
 
-class CaatDashApplication(Application):
-    def __init__(self, handlers, options, **settings):
-        self.cache = None
+        self.filter_specs = {}
+        self.filter_spec_digests = {}
 
-        self.faq = None
-        self.faq_mtime = None
+        for lang in [None] + sorted(self.i18n or {}):
+            i18n = self.i18n[lang] if lang else gettext.NullTranslations()
+            data = {k: v.spec_data(i18n) for k, v in self.filters.items()}
+            body = self.dump_json(
+                data, indent=None, separators=(",", ":"), sort_keys=True).encode()
+            digest = hashlib.blake2b(body, digest_size=10).hexdigest()
 
-        self.i18n = None
-        self.i18n_options = None
+            bodies = {None: body}
+            for name, compress in RESPONSE_ENCODINGS.items():
+                bodies[name] = compress(body)
 
-        self.filters = {}
+            self.filter_specs[digest] = bodies
+            self.filter_spec_digests[lang] = digest
 
-        super().__init__(handlers, options, **settings)
 
+    def filter_spec_url(self, lang=None) -> Union[str, None]:
+        """
+        Return the URL of the filter specs in `lang`, falling back to the
+        untranslated specs, or `None` if the `filter_spec_path` setting
+        is absent or specs have not been built.
+        """
 
-    # Cache & Serialization
+        path = self.settings.get("filter_spec_path", None)
+        digest = self.filter_spec_digests.get(lang, None) or \
+            self.filter_spec_digests.get(None, None)
 
-    def dump_json(self, obj, **kwargs):
-        kwargs = dict({
-            "indent": 2,
-            "separators": (", ", ": ")
-        }, **kwargs)
-        serializer = self.json_serializer if hasattr(self, "json_serializer") else None
-        s = json.dumps(obj, default=serializer, **kwargs)
-        return s
+        if not (path and digest):
+            return None
 
+        return f"{path}/{digest}.json"
 
-    def cache_get_json(self, key, accept_old=False):
-        value = self.settings.cache.get_item(key, accept_old=accept_old)
-        return value and json.loads(value)
 
+    def autocomplete_index(self, key, lang=None) -> AutocompleteIndex:
+        """
+        Return the autocomplete index of the `FilterGroupedSet` with
+        `allowSearchText` and key `key`, in language `lang`, building
+        it on first use.
 
-    def cache_set_json(
-            self, key, value, valuable=False, expired=False):
+        Raise `KeyError` if there is no such filter.
+        """
 
-        ttl = CACHE_TTL_LONG if valuable else CACHE_TTL_SHORT
+        filter_ = self.filters[key]
+        if not (isinstance(filter_, FilterGroupedSet) and filter_.allow_search_text):
+            raise KeyError(key)
 
-        if value is None:
-            value = False
+        i18n = self.i18n.get(lang, None) if self.i18n else None
+        if i18n is None:
+            lang = None
+            i18n = gettext.NullTranslations()
 
-        value = self.dump_json(value, indent=None, separators=(",", ":"),)
-        status = self.settings.cache.set_item(key, value, ttl=ttl, expired=expired)
+        with self.autocomplete_lock:
+            index = self.autocomplete_indexes.get((key, lang), None)
+            if index is None:
+                index = AutocompleteIndex(filter_.autocomplete_entries(i18n))
+                self.autocomplete_indexes[(key, lang)] = index
 
-        return status
+        return index
 
 
     # FAQ
@@ -784,7 +2562,24 @@ class BaseHandler(FirmaBaseHandler):
         super().__init__(*args, **kwargs)
         self.start = None
         self.profile = None
-        self.raw_params = self.get_raw_params(self.request.uri)
+        self.cache_prefetched = {}
+        self.cache_generation_memo = {}
+        self.response_capture = None
+        self.response_degraded = False
+
+
+    @functools.cached_property
+    def raw_params(self):
+        """
+        Parsed on first access, so requests that do not use query
+        parameters do not pay for them.
+        """
+
+        return self.get_raw_params(
+            self.request.uri,
+            max_params=self.settings.get("query_params_max", QUERY_PARAMS_MAX),
+            max_length=self.settings.get("query_length_max", QUERY_LENGTH_MAX),
+        )
 
 
     @property
@@ -795,17 +2590,284 @@ class BaseHandler(FirmaBaseHandler):
     def cache_set_json(self):
         return self.application.cache_set_json
 
+    @property
+    def cache_get_many(self):
+        return self.application.cache_get_many
+
+    @property
+    def cache_set_many(self):
+        return self.application.cache_set_many
+
+    @property
+    def cache_coalesce(self):
+        return self.application.cache_coalesce
+
+    @property
+    def cache_coalesce_async(self):
+        return self.application.cache_coalesce_async
+
+    @property
+    def compute_async(self):
+        return self.application.compute_async
+
+    @property
+    def compute_blocking(self):
+        return self.application.compute_blocking
+
+    @property
+    def admit(self):
+        return self.application.admit
+
+    @property
+    def admit_async(self):
+        return self.application.admit_async
+
+    @property
+    def cache_refresh(self):
+        return self.application.cache_refresh
+
+    @property
+    def cache_refresh_enabled(self):
+        return self.application.cache_refresh_enabled
+
+    @property
+    def metrics(self):
+        return self.application.metrics
+
+    @property
+    def filter_plan(self):
+        return self.application.filter_plan_for(self.filters)
+
+    def filter_spec_url(self, lang=None) -> Union[str, None]:
+        """
+        As `CaatDashApplication.filter_spec_url`, prefixed with `url_root`,
+        for use in pages.
+        """
+
+        url = self.application.filter_spec_url(lang)
+        return None if url is None else self.url_root + url
+
     @property
     def json_serializer(self):
         return self.application.json_serializer
 
+    @property
+    def json_pretty(self) -> bool:
+        return bool(self.get_argument_boolean("pretty"))
+
     @property
     def dump_json(self):
-        return self.application.dump_json
+        """
+        Output is compact unless the `pretty` query parameter is set
+        or indentation is explicitly requested.
+        """
+
+        if self.json_pretty:
+            return self.application.dump_json
+        return functools.partial(
+            self.application.dump_json, indent=None, separators=(",", ":"))
+
+    @property
+    def dump_json_iter(self):
+        """
+        As `dump_json`, compact unless the `pretty` query parameter is set.
+        """
+
+        if self.json_pretty:
+            return self.application.dump_json_iter
+        return functools.partial(
+            self.application.dump_json_iter, indent=None, separators=(",", ":"))
+
+
+    async def write_json_stream(
+            self, obj, chunk_size=JSON_CHUNK_SIZE, min_values=JSON_STREAM_MIN_VALUES,
+            **kwargs
+    ):
+        """
+        Write `obj` as JSON, flushing each chunk to the client as it is
+        encoded, if `json_length` of `obj` is over `min_values`, otherwise
+        all at once with `dump_json`, which is faster (see `dump_json_iter`).
+        `kwargs` are passed to `dump_json_iter` or `dump_json`.
+        """
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+
+        if json_length(obj) <= min_values:
+            self.write(self.dump_json(obj, **kwargs))
+            return
+
+        for chunk in self.dump_json_iter(obj, chunk_size=chunk_size, **kwargs):
+            self.write(chunk)
+            await self.flush()
+
+
+    def write(self, chunk):
+        super().write(chunk)
+
+        if self.response_capture is not None:
+            # As converted by `tornado.web.RequestHandler.write`:
+            if isinstance(chunk, dict):
+                chunk = tornado.escape.json_encode(chunk)
+            self.response_capture.append(tornado.escape.utf8(chunk))
+
+
+    @staticmethod
+    def registered_sources() -> set:
+        """
+        Return the names of all data sources of `cache_and_profile` functions.
+        """
+
+        sources = set()
+        for function in cache_and_profile.registry:
+            sources.update(function.cache_and_profile.sources or [])
+        return sources
+
+
+    def response_cache_key(self) -> str:
+        """
+        Return a cache key for the whole response, from the canonical URL
+        given by `query_rewrite`, `cache_key_context` and the current
+        generation of every registered data source.
+        """
+
+        canonical = (
+            self.query_rewrite(),
+            self.cache_key_context(),
+            self.cache_generations(self.registered_sources()),
+        )
+
+        return f"response-url:{fingerprint(canonical)}"
+
+
+    def etag_canonical(self, sources=None) -> str:
+        """
+        Return a weak ETag for the response to this request, derived from
+        the path, the canonical request arguments, `cache_key_context`
+        and the current generation of each of `sources`, without computing
+        the response.
+
+        `sources` defaults to every source named by a `cache_and_profile`
+        function.
+        """
+
+        if sources is None:
+            sources = self.registered_sources()
+
+        canonical = (
+            self.request.path,
+            canonical_filter_dict(self.application.filters, self.request_args),
+            self.cache_key_context(),
+            self.cache_generations(sources),
+        )
+
+        return 'W/"%s"' % fingerprint(canonical)
+
+
+    def check_etag_canonical(self, sources=None, max_age=CACHE_TTL_SHORT) -> bool:
+        """
+        Set `ETag` and `Cache-Control` headers for this request.
+
+        Return `True`, having set a status of 304, if the request's
+        `If-None-Match` header matches, in which case the handler should
+        finish without computing anything.
+
+        Pass a shorter `max_age` for clients to revalidate sooner,
+        eg. to see new generations of `sources`.
+        """
+
+        self.set_header("ETag", self.etag_canonical(sources))
+        self.set_header("Cache-Control", f"public, max-age={max_age}")
+
+        if self.check_etag_header():
+            self.set_status(304)
+            return True
+
+        return False
+
+
+    async def write_json_precompressed(self, key, compute, valuable=False):
+        """
+        Write the JSON of the value returned by `compute`, which may be a
+        coroutine function, from compressed response bodies cached under
+        `key`.
+
+        On a miss the compact JSON body is compressed with each available
+        content coding and stored together with a strong ETag. On a hit the
+        stored bytes are written with no decoding, encoding or compression.
+
+        Bypassed if the `pretty` or `cache=false` query parameters are set.
+        """
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+
+        if self.json_pretty or self.get_argument_boolean("cache") is False:
+            data = compute()
+            if inspect.isawaitable(data):
+                data = await data
+            self.write(self.dump_json(data))
+            return
+
+        accepted = accept_encodings(self.request.headers.get("Accept-Encoding", None))
+        encodings = [v for v in RESPONSE_ENCODINGS if v in accepted]
+        # Clients accepting no available coding are sent decompressed gzip.
+        encoding = encodings[0] if encodings else "gzip"
+
+        response_key = f"response:{key}"
+        record = self.application.cache_get_bytes(f"{response_key}:{encoding}")
+
+        if record is None:
+            data = compute()
+            if inspect.isawaitable(data):
+                data = await data
+
+            body = self.application.dump_json(
+                data, indent=None, separators=(",", ":")).encode()
+            digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+            for name, compress in RESPONSE_ENCODINGS.items():
+                # Strong validators must differ between content codings.
+                etag = f'"{digest}-{name}"'
+                value = etag.encode() + b"\n" + compress(body)
+                self.application.cache_set_bytes(
+                    f"{response_key}:{name}", value, valuable=valuable)
+                if name == encoding:
+                    record = value
+
+        (etag, payload) = record.split(b"\n", 1)
+        etag = etag.decode()
+        if not encodings:
+            # The decompressed body has the digest alone as its ETag.
+            etag = etag.replace(f'-{encoding}"', '"')
+
+        self.set_header("ETag", etag)
+        self.add_header("Vary", "Accept-Encoding")
+
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        if encodings:
+            self.set_header("Content-Encoding", encoding)
+        else:
+            payload = RESPONSE_DECODINGS[encoding](payload)
+
+        self.write(payload)
 
 
     # Query parameter handling
 
+    def evaluate_filters(self, **kwargs) -> FilterEvaluation:
+        """
+        Evaluate `filters` for the query parameters of this request,
+        with `filter_plan` if filters have been compiled.
+
+        `kwargs` are passed to each filter's `request_args`.
+        """
+
+        plan = self.filter_plan or FilterPlan(self.filters, precompute=False)
+        return plan.evaluate(self.raw_params, handler=self, **kwargs)
+
+
     def query_rewrite(
             self,
             path: Union[str, None] = None,
@@ -861,10 +2923,14 @@ class BaseHandler(FirmaBaseHandler):
 
         # Set filters & Partition Filters & Date filters
 
-        all_keys = set()
-        for key, filter_ in self.filters.items():
-            query_parts += filter_.query_params(args)
-            all_keys |= filter_.keys()
+        if self.filter_plan:
+            query_parts += self.filter_plan.query_params(args)
+            all_keys = self.filter_plan.keys
+        else:
+            all_keys = set()
+            for key, filter_ in self.filters.items():
+                query_parts += filter_.query_params(args)
+                all_keys |= filter_.keys()
 
 
         for key, value in list(args.items()):
@@ -926,33 +2992,52 @@ class BaseHandler(FirmaBaseHandler):
         return re.sub(r'href="/', f'href="{self.url_root}/', text)
 
 
+    re_query_split = re.compile(r"[&;]")
+
     @staticmethod
-    def get_raw_params(uri):
+    def get_raw_params(uri, max_params=None, max_length=None):
         """
         Get query string parameters with unencoded keys but still encoded values.
 
         Returns either `None` or a list of strings, one for each time the key
         appears in the query string.
+
+        Raise a 400 error if there are more than `max_params` parameters,
+        or any is longer than `max_length` characters before decoding.
         """
 
         params = defaultdict(list)
 
-        query_string = urllib.parse.urlsplit(uri)[3]
-        parts = re.compile(r"[&;]").split(query_string)
+        query_string = uri.partition("?")[2].partition("#")[0]
+        maxsplit = -1 if max_params is None else max_params
+        if ";" in query_string:
+            parts = BaseHandler.re_query_split.split(query_string, maxsplit=max(maxsplit, 0))
+        else:
+            # Much faster than the regular expression for long query strings.
+            parts = query_string.split("&", maxsplit)
+        if max_params is not None and len(parts) > max_params:
+            raise tornado.web.HTTPError(
+                400, "More than %d query parameters.", max_params)
+
         for part in parts:
-            part = urllib.parse.unquote(part)
-            e = part.split("=", 1)
-            if len(e) == 2:
-                (key, value) = e
-            else:
-                (key, ) = e
+            if max_length is not None and len(part) > max_length:
+                raise tornado.web.HTTPError(
+                    400, "Query parameter longer than %d characters.", max_length)
+
+            if "%" in part:
+                part = urllib.parse.unquote(part)
+            (key, sep, value) = part.partition("=")
+            if not sep:
                 value = None
-            key = urllib.parse.unquote_plus(key)
+            if "%" in key or "+" in key:
+                key = urllib.parse.unquote_plus(key)
             params[key].append(value)
 
         return params
 
 
+    re_split_items = re.compile(r"(?:,)(?=[\w\"])")
+
     @staticmethod
     def set_values(raw_params, key):
         # Only split on commas if they are followed by
@@ -962,11 +3047,9 @@ class BaseHandler(FirmaBaseHandler):
         # This should be moved outside CAAT Dash and handled by
         # functions or patterns supplied by individual apps
 
-        re_split_items = re.compile(r"(?:,)(?=[\w\"])")
-
         values = set()
         for instance_value in raw_params.get(key, []):
-            for v in re_split_items.split(instance_value):
+            for v in BaseHandler.re_split_items.split(instance_value):
                 v = urllib.parse.unquote_plus(v)
                 v = v.strip()
                 if not v:
@@ -985,6 +3068,194 @@ class BaseHandler(FirmaBaseHandler):
                 % (name, ",".join(values - items)))
 
 
+    def write_error(self, status_code, **kwargs):
+        exc_info = kwargs.get("exc_info", None)
+        if exc_info and isinstance(exc_info[1], AdmissionRejected):
+            self.set_header("Retry-After", str(exc_info[1].retry_after))
+
+        super().write_error(status_code, **kwargs)
+
+
+    # Latency budget
+
+    def latency_budget(self) -> Union[float, None]:
+        """
+        Return the seconds allowed for this request, from the `budget` query
+        parameter or the `latency_budget` option, both in milliseconds,
+        or `None` if there is no budget.
+        """
+
+        budget = self.get_argument_uint("budget")
+        if budget is None:
+            budget = getattr(self.application.settings.options, "latency_budget", None)
+
+        return budget / 1000 if budget else None
+
+
+    def budget_remaining(self) -> Union[float, None]:
+        budget = self.latency_budget()
+        if budget is None:
+            return None
+
+        return budget - self.request.request_time()
+
+
+    def budget_exhausted(self, required=None) -> bool:
+        """
+        Return `True` if less than `required` seconds remain of the
+        latency budget, or none at all if `required` is `None`.
+        """
+
+        remaining = self.budget_remaining()
+        if remaining is None:
+            return False
+
+        return remaining <= (required or 0)
+
+
+    # Widgets
+
+    async def compute_widgets(self, widgets: dict, timeout=None) -> dict:
+        """
+        Compute independent widgets concurrently and return a dict of
+        their results.
+
+        `widgets`: dict of names and either awaitables, such as calls of
+          `cache_and_profile_async` functions, or functions of no arguments,
+          which are run in the application's compute executor if it is a
+          thread pool, otherwise in the IOLoop's default executor, as
+          closures cannot be sent to a process pool.
+        `timeout`: Seconds to wait for each widget. A widget that does not
+          finish in time has the result `WIDGET_PENDING` instead, but
+          continues in the background so that its value is cached.
+        """
+
+        loop = IOLoop.current()
+        executor = None if self.application.compute_process \
+            else self.application.compute_executor
+
+        async def run(widget):
+            if inspect.isawaitable(widget):
+                future = asyncio.ensure_future(widget)
+            else:
+                future = loop.run_in_executor(executor, widget)
+
+            if timeout is None:
+                return await future
+
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                self.response_degraded = True
+                return dict(WIDGET_PENDING)
+
+        names = list(widgets)
+        results = await asyncio.gather(*[run(widgets[v]) for v in names])
+
+        return dict(zip(names, results))
+
+
+    def cache_prefetch(self, calls):
+        """
+        Look up the cached values of several `cache_and_profile` functions
+        at once, so that calling them afterwards needs no further cache
+        round trip and only misses are computed.
+
+        `calls`: list of `(function, filter_dict, kwargs)` tuples,
+          where `kwargs` may be `None`.
+        """
+
+        if self.get_argument_boolean("cache") is False:
+            return
+
+        sources = set()
+        for (function, _filter_dict, _kwargs) in calls:
+            sources.update(function.cache_and_profile.sources or [])
+        self.cache_generations(sources)
+
+        keys = [
+            function.cache_and_profile.cache_key(self, filter_dict, **(kwargs or {}))
+            for (function, filter_dict, kwargs) in calls
+        ]
+
+        found = self.cache_get_many(keys)
+        for key in keys:
+            self.cache_prefetched[key] = found.get(key, None)
+
+
+    def cache_generations(self, sources) -> tuple:
+        """
+        Return `(source, generation)` pairs for `sources`, reading each
+        generation at most once per request.
+        """
+
+        missing = [v for v in sources if v not in self.cache_generation_memo]
+        if missing:
+            self.cache_generation_memo.update(
+                self.application.cache_get_generations(missing))
+
+        return tuple((v, self.cache_generation_memo[v]) for v in sorted(sources))
+
+
+    def cache_get_request(self, key):
+        """
+        Return the value for `key`, from `cache_prefetch` if it was
+        looked up there, otherwise from the cache.
+        """
+
+        if key in self.cache_prefetched:
+            return self.cache_prefetched.pop(key)
+
+        return self.cache_get_json(key)
+
+
+    def cache_key_context(self) -> tuple:
+        """
+        Return values other than filters that affect cached results.
+
+        Override this if results also depend on, for example,
+        a language chosen by cookie.
+        """
+
+        return (self.get_argument("lang", None), )
+
+
+    cache_key_filtered_warned = set()
+
+    def cache_key_canonical(self, key, filter_dict, **kwargs):
+        """
+        Return a cache key for `key` that is the same for all equivalent
+        `filter_dict` and `kwargs` values.
+
+        A `cache_key_filtered(key, filter_dict, **kwargs)` method defined
+        by an application handler, which previously built cache keys, is
+        deprecated in favour of `cache_key_context` and ignored, unless
+        the `cache_key_legacy` setting is true, in which case its result
+        is used as the key instead.
+        """
+
+        cache_key_filtered = getattr(self, "cache_key_filtered", None)
+        if cache_key_filtered:
+            if self.settings.get("cache_key_legacy", False):
+                return cache_key_filtered(key, filter_dict, **kwargs)
+
+            name = type(self).__name__
+            if name not in self.cache_key_filtered_warned:
+                self.cache_key_filtered_warned.add(name)
+                app_log.warning(
+                    "`%s.cache_key_filtered` is deprecated and ignored. "
+                    "Override `cache_key_context` instead, or set "
+                    "`cache_key_legacy` to keep using it.", name)
+
+        canonical = (
+            canonical_filter_dict(self.application.filters, filter_dict),
+            canonical_value(kwargs),
+            self.cache_key_context(),
+        )
+
+        return f"{key}:{fingerprint(canonical)}"
+
+
     def get_argument_uint(self, name, default=None):
         value = self.get_argument(name, default=default)
         if value:
@@ -1041,3 +3312,71 @@ class BaseHandler(FirmaBaseHandler):
 
     def get_argument_order(self):
         return self.get_argument_option("order", ("asc", "desc"))
+
+
+
+class FilterAutocompleteHandler(BaseHandler):
+    """
+    Autocomplete values of a `FilterGroupedSet` with `allowSearchText`,
+    whose key is the path argument, from its in-memory index.
+
+    Query parameters are `term`, `exclude` (values already selected),
+    `limit` and `lang`.
+    """
+
+    def get(self, key):
+        lang = self.get_argument("lang", None)
+
+        try:
+            index = self.application.autocomplete_index(key, lang)
+        except KeyError:
+            raise tornado.web.HTTPError(404, "No autocomplete for filter `%s`.", key)
+
+        term = self.get_argument("term", "")
+        exclude = self.get_argument_set("exclude")
+        limit = self.get_argument_uint("limit", AUTOCOMPLETE_LIMIT)
+        limit = min(limit or AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_LIMIT_MAX)
+
+        result = index.search(term, exclude=exclude, limit=limit)
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.set_header("Cache-Control", f"public, max-age={AUTOCOMPLETE_MAX_AGE}")
+        self.write(self.dump_json(result))
+
+
+
+class FilterSpecHandler(BaseHandler):
+    """
+    Serve filter specs built by `CaatDashApplication.build_filter_specs`.
+
+    The path argument is a hash of the content, so responses never
+    change and may be cached indefinitely.
+    """
+
+    def get(self, digest):
+        bodies = self.application.filter_specs.get(digest, None)
+        if bodies is None:
+            raise tornado.web.HTTPError(404, "No filter specs with hash `%s`.", digest)
+
+        accepted = accept_encodings(self.request.headers.get("Accept-Encoding", None))
+        encodings = [v for v in RESPONSE_ENCODINGS if v in accepted]
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.set_header(
+            "Cache-Control", f"public, max-age={FILTER_SPEC_MAX_AGE}, immutable")
+        # Strong validators must differ between content codings.
+        if encodings:
+            self.set_header("ETag", f'"{digest}-{encodings[0]}"')
+        else:
+            self.set_header("ETag", f'"{digest}"')
+        self.add_header("Vary", "Accept-Encoding")
+
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        if encodings:
+            self.set_header("Content-Encoding", encodings[0])
+            self.write(bodies[encodings[0]])
+        else:
+            self.write(bodies[None])
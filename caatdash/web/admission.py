@@ -0,0 +1,151 @@
+"""
+Limit the number of concurrent cache-miss computations.
+"""
+
+import time
+import asyncio
+import threading
+import contextlib
+
+import tornado.web
+
+
+
+def event_loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+
+class AdmissionRejected(tornado.web.HTTPError):
+    def __init__(self, key, retry_after):
+        super().__init__(
+            503, "Too many concurrent computations for `%s`.", key)
+        self.retry_after = retry_after
+
+
+
+class AdmissionControl():
+    """
+    Limit concurrent computations to `limit` in total, and to `limits[key]`
+    or `key_limit` for each key. Computations over the limit wait for up to
+    `wait` seconds, after which `AdmissionRejected` is raised. `admit` in
+    a thread running an event loop does not wait, so as not to block it.
+
+    `metrics`: `caatdash.web.metrics.Metrics` instance in which to declare
+    and record admission metrics.
+    """
+
+    def __init__(
+            self, limit=None, limits=None, key_limit=None,
+            wait=1.0, retry_after=5, metrics=None
+    ):
+        self.limit = limit
+        self.limits = dict(limits or {})
+        self.key_limit = key_limit
+        self.wait = wait
+        self.retry_after = retry_after
+        self.metrics = metrics
+
+        self.lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(limit) if limit else None
+        self.key_semaphores = {}
+
+        if self.metrics:
+            self.metrics.gauge(
+                "caatdash_admission_limit",
+                "Maximum concurrent computations, by key, or in total for key `*`.")
+            self.metrics.gauge(
+                "caatdash_admission_active",
+                "Computations in progress, by key.")
+            self.metrics.gauge(
+                "caatdash_admission_queued",
+                "Computations waiting for admission, by key.")
+            self.metrics.counter(
+                "caatdash_admission_rejected_total",
+                "Computations rejected after waiting for admission, by key.")
+
+            if limit:
+                self.metrics.set("caatdash_admission_limit", limit, key="*")
+            for key, value in self.limits.items():
+                self.metrics.set("caatdash_admission_limit", value, key=key)
+
+
+    def key_semaphore(self, key):
+        with self.lock:
+            if key not in self.key_semaphores:
+                limit = self.limits.get(key, self.key_limit)
+                self.key_semaphores[key] = threading.BoundedSemaphore(limit) if limit else None
+                if limit and key not in self.limits and self.metrics:
+                    self.metrics.set("caatdash_admission_limit", limit, key=key)
+            return self.key_semaphores[key]
+
+
+    def record(self, name, key, value=1):
+        if self.metrics:
+            self.metrics.inc(name, value, key=key)
+
+
+    def acquire(self, key, wait=None):
+        """
+        Block until admitted, for up to `wait` seconds (default `self.wait`),
+        and return the semaphores to release, or raise `AdmissionRejected`.
+        """
+
+        if wait is None:
+            wait = self.wait
+
+        # Always acquire in the same order to avoid deadlock.
+        semaphores = [v for v in (self.key_semaphore(key), self.semaphore) if v]
+        acquired = []
+        deadline = time.monotonic() + wait
+
+        self.record("caatdash_admission_queued", key)
+        try:
+            for semaphore in semaphores:
+                timeout = deadline - time.monotonic()
+                if not (semaphore.acquire(timeout=timeout) if timeout > 0
+                        else semaphore.acquire(blocking=False)):
+                    for v in acquired:
+                        v.release()
+                    self.record("caatdash_admission_rejected_total", key)
+                    raise AdmissionRejected(key, self.retry_after)
+                acquired.append(semaphore)
+        finally:
+            self.record("caatdash_admission_queued", key, -1)
+
+        self.record("caatdash_admission_active", key)
+        return acquired
+
+
+    def release(self, key, acquired):
+        for semaphore in acquired:
+            semaphore.release()
+        self.record("caatdash_admission_active", key, -1)
+
+
+    @contextlib.contextmanager
+    def admit(self, key):
+        acquired = self.acquire(key, wait=0 if event_loop_running() else None)
+        try:
+            yield
+        finally:
+            self.release(key, acquired)
+
+
+    @contextlib.asynccontextmanager
+    async def admit_async(self, key):
+        """
+        As `admit`, but waits in an executor thread instead of blocking
+        the event loop.
+        """
+
+        acquired = await asyncio.get_running_loop().run_in_executor(
+            None, self.acquire, key)
+        try:
+            yield
+        finally:
+            self.release(key, acquired)
@@ -0,0 +1,139 @@
+"""
+In-memory index for autocompleting filter values on the server.
+"""
+
+import bisect
+import unicodedata
+from collections import defaultdict
+
+from caatdash.web.cache import LocalCache
+
+
+
+AUTOCOMPLETE_LIMIT = 16
+AUTOCOMPLETE_LIMIT_MAX = 100
+AUTOCOMPLETE_MAX_AGE = 60 * 60         # One hour
+AUTOCOMPLETE_CACHE_BYTES = 1024 * 1024
+AUTOCOMPLETE_CACHE_TTL = 60 * 60
+NGRAM_LENGTH = 3
+
+
+
+def fold(text) -> str:
+    """
+    Return `text` without accents and case, for matching.
+    """
+
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join([v for v in text if not unicodedata.combining(v)])
+    return text.casefold()
+
+
+
+def ngrams(text, length=NGRAM_LENGTH) -> set:
+    return {text[i:i + length] for i in range(len(text) - length + 1)}
+
+
+
+class AutocompleteIndex():
+    """
+    Index of `entries`, dictionaries with `value` and `label` keys,
+    searched by accent- and case-insensitive matching of labels.
+
+    As in the client's `filterSearch`, each space-separated part of the
+    search term scores 2 for an entry if it matches the start of a word
+    in the label, or 1 if it matches elsewhere. Entries are ranked by
+    total score, then by their order in `entries`.
+
+    Words are held in a sorted list for prefix matches, and n-grams
+    in an inverted index for other matches. Results are cached in an
+    LRU of `cache_bytes`.
+    """
+
+    def __init__(self, entries, cache_bytes=AUTOCOMPLETE_CACHE_BYTES):
+        self.entries = [
+            {
+                "value": v["value"],
+                "label": v["label"],
+            } for v in entries
+        ]
+        self.texts = [fold(v["label"]) for v in self.entries]
+
+        words = sorted({
+            (word, i)
+            for i, text in enumerate(self.texts)
+            for word in text.split()
+        })
+        self.words = [v[0] for v in words]
+        self.word_ids = [v[1] for v in words]
+
+        index = defaultdict(set)
+        for i, text in enumerate(self.texts):
+            for ngram in ngrams(text):
+                index[ngram].add(i)
+        self.ngrams = {k: frozenset(v) for k, v in index.items()}
+
+        self.cache = LocalCache(cache_bytes)
+
+
+    def prefix_ids(self, part) -> set:
+        ids = set()
+        start = bisect.bisect_left(self.words, part)
+        for i in range(start, len(self.words)):
+            if not self.words[i].startswith(part):
+                break
+            ids.add(self.word_ids[i])
+
+        return ids
+
+
+    def substring_ids(self, part) -> set:
+        if len(part) < NGRAM_LENGTH:
+            candidates = range(len(self.texts))
+        else:
+            sets = sorted(
+                [self.ngrams.get(v, frozenset()) for v in ngrams(part)], key=len)
+            candidates = sets[0].intersection(*sets[1:])
+
+        return {i for i in candidates if part in self.texts[i]}
+
+
+    def search(self, term, exclude=None, limit=AUTOCOMPLETE_LIMIT) -> list:
+        """
+        Return up to `limit` entries matching `term`, best first,
+        omitting those whose value is in `exclude`.
+        """
+
+        parts = tuple(fold(term or "").split())
+        exclude = frozenset(exclude or ())
+
+        key = (parts, tuple(sorted(exclude, key=str)), limit)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        if parts:
+            scores = defaultdict(int)
+            for part in parts:
+                prefix = self.prefix_ids(part)
+                for i in prefix:
+                    scores[i] += 2
+                for i in self.substring_ids(part) - prefix:
+                    scores[i] += 1
+            ids = sorted(scores, key=lambda i: (-scores[i], i))
+        else:
+            ids = range(len(self.entries))
+
+        result = []
+        for i in ids:
+            if len(result) >= limit:
+                break
+            entry = self.entries[i]
+            if entry["value"] in exclude:
+                continue
+            result.append(entry)
+
+        size = sum([len(v["label"]) + len(str(v["value"])) for v in result]) + 64
+        self.cache.set(key, result, size, AUTOCOMPLETE_CACHE_TTL)
+
+        return result
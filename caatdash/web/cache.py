@@ -0,0 +1,158 @@
+"""
+Cache tiers and helpers used by `cache_and_profile`.
+"""
+
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+
+
+class LocalCache():
+    """
+    In-process LRU cache of already-decoded values.
+
+    The total size of entries is bounded by `max_bytes`, where the size of
+    an entry is the length of its serialized form in the shared cache.
+
+    Entries expire after the `ttl` given to `set`, or `max_ttl` seconds
+    if that is shorter.
+
+    Values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_bytes, max_ttl=None):
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def get(self, key):
+        """
+        Return the value for `key`, or `None` if absent or expired.
+        """
+
+        now = time.monotonic()
+
+        with self.lock:
+            item = self.items.get(key, None)
+            if item is None:
+                return None
+
+            (expires, size, value) = item
+            if expires <= now:
+                del self.items[key]
+                self.size -= size
+                return None
+
+            self.items.move_to_end(key)
+            return value
+
+
+    def set(self, key, value, size, ttl):
+        if self.max_ttl is not None:
+            ttl = min(ttl, self.max_ttl)
+        expires = time.monotonic() + ttl
+
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+
+            if size > self.max_bytes:
+                return
+
+            self.items[key] = (expires, size, value)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                (_key, item) = self.items.popitem(last=False)
+                self.size -= item[1]
+
+
+    def delete(self, key):
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+
+
+class SingleFlight():
+    """
+    Coalesce concurrent calls for the same key, so that one caller
+    runs the function and the others wait for its result.
+    """
+
+    class Call():
+        def __init__(self):
+            self.event = threading.Event()
+            self.value = None
+            self.error = None
+
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+
+    def do(self, key, f):
+        with self.lock:
+            call = self.calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = f()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+        return call.value
+
+
+
+class AsyncSingleFlight():
+    """
+    Coalesce concurrent calls of a coroutine function for the same key
+    on one event loop.
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+
+    async def do(self, key, f):
+        task = self.calls.get(key, None)
+
+        if task is None:
+            task = asyncio.ensure_future(f())
+            self.calls[key] = task
+            task.add_done_callback(lambda _task: self.calls.pop(key, None))
+
+        # Shield so that a cancelled waiter does not cancel the others.
+        return await asyncio.shield(task)
@@ -0,0 +1,240 @@
+"""
+Encodings for values stored in the shared cache,
+and for compressed response bodies.
+
+Encoded values are bytes starting with a tag that names the codec and
+compression used, so entries stay readable when the configured codec
+changes. Values with no tag are plain JSON text, as written before codecs
+were introduced.
+
+`msgpack`, `lz4` and `brotli` are optional and only available if installed. Unlike
+JSON, `msgpack` preserves non-string dictionary keys.
+"""
+
+import gzip
+import json
+import zlib
+from typing import Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+
+TAG_START = b"\x00"
+TAG_END = b":"
+
+
+
+class JsonCodec():
+    name = "json"
+
+    @staticmethod
+    def encode(value, default=None) -> bytes:
+        return json.dumps(value, default=default, separators=(",", ":")).encode()
+
+    @staticmethod
+    def decode(data: bytes):
+        return json.loads(data)
+
+
+
+class MsgpackCodec():
+    name = "msgpack"
+
+    @staticmethod
+    def encode(value, default=None) -> bytes:
+        return msgpack.packb(value, default=default, use_bin_type=True)
+
+    @staticmethod
+    def decode(data: bytes):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+
+class ZlibCompression():
+    name = "zlib"
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return zlib.compress(data, 6)
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+
+class Lz4Compression():
+    name = "lz4"
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return lz4_frame.compress(data)
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return lz4_frame.decompress(data)
+
+
+
+CODECS = {
+    v.name: v for v in (
+        JsonCodec,
+        MsgpackCodec if msgpack else None,
+    ) if v
+}
+COMPRESSIONS = {
+    v.name: v for v in (
+        ZlibCompression,
+        Lz4Compression if lz4_frame else None,
+    ) if v
+}
+
+
+
+class CacheCodec():
+    """
+    Encode values with `codec`, and compress them with `compression` if
+    the encoded size is at least `threshold` bytes.
+
+    Any tagged value can be decoded, whatever codec and compression are
+    configured, as long as they are available.
+    """
+
+    def __init__(self, codec="json", compression=None, threshold=1024, default=None):
+        if codec not in CODECS:
+            raise Exception(f"Cache codec `{codec}` is not available.")
+        if compression and compression not in COMPRESSIONS:
+            raise Exception(f"Cache compression `{compression}` is not available.")
+
+        self.codec = CODECS[codec]
+        self.compression = COMPRESSIONS[compression] if compression else None
+        self.threshold = threshold
+        self.default = default
+
+
+    @staticmethod
+    def tag(codec, compression=None) -> bytes:
+        name = codec.name
+        if compression:
+            name += "+" + compression.name
+        return TAG_START + name.encode() + TAG_END
+
+
+    def encode(self, value) -> bytes:
+        data = self.codec.encode(value, default=self.default)
+
+        compression = None
+        if self.compression and len(data) >= self.threshold:
+            compression = self.compression
+            data = compression.compress(data)
+
+        return self.tag(self.codec, compression) + data
+
+
+    @staticmethod
+    def decode(data: Union[bytes, str]):
+        if isinstance(data, str):
+            return json.loads(data)
+
+        if not data.startswith(TAG_START):
+            return json.loads(data)
+
+        end = data.index(TAG_END)
+        name = data[len(TAG_START):end].decode()
+        data = data[end + len(TAG_END):]
+
+        (codec_name, _sep, compression_name) = name.partition("+")
+
+        if compression_name:
+            try:
+                compression = COMPRESSIONS[compression_name]
+            except KeyError:
+                raise Exception(
+                    f"Cache compression `{compression_name}` is not available.")
+            data = compression.decompress(data)
+
+        try:
+            codec = CODECS[codec_name]
+        except KeyError:
+            raise Exception(f"Cache codec `{codec_name}` is not available.")
+
+        return codec.decode(data)
+
+
+
+# Response bodies
+
+
+
+def gzip_compress(data: bytes) -> bytes:
+    # A fixed `mtime` keeps output identical for identical input.
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+
+def brotli_compress(data: bytes) -> bytes:
+    # The default quality of 11 is too slow to use while serving a request.
+    return brotli.compress(data, quality=5)
+
+
+
+# In order of preference.
+RESPONSE_ENCODINGS = {
+    k: v for k, v in (
+        ("br", brotli_compress if brotli else None),
+        ("gzip", gzip_compress),
+    ) if v
+}
+RESPONSE_DECODINGS = {
+    k: v for k, v in (
+        ("br", brotli.decompress if brotli else None),
+        ("gzip", gzip.decompress),
+    ) if v
+}
+
+
+
+def accept_encodings(header: Union[str, None]) -> set:
+    """
+    Return the set of content codings acceptable according to
+    an `Accept-Encoding` header value.
+    """
+
+    accepted = set()
+    refused = set()
+
+    for part in (header or "").split(","):
+        (coding, _sep, params) = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        for param in params.split(";"):
+            (name, _sep, value) = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+
+        (accepted if quality > 0 else refused).add(coding)
+
+    if "*" in accepted:
+        accepted |= set(RESPONSE_ENCODINGS) - refused
+
+    return accepted
@@ -0,0 +1,139 @@
+"""
+Aggregate counters and histograms, exposed in Prometheus text format.
+"""
+
+import bisect
+import threading
+from collections import defaultdict
+
+import tornado.web
+
+
+
+TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+
+    def escape(value):
+        return (
+            str(value)
+            .replace("\\", "\\\\")
+            .replace("\n", "\\n")
+            .replace('"', '\\"')
+        )
+
+    return "{" + ",".join([f'{k}="{escape(v)}"' for k, v in labels]) + "}"
+
+
+
+def format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+
+class Metrics():
+    """
+    Thread-safe store of metrics.
+
+    Metrics must be declared with `counter`, `gauge` or `histogram` before
+    use. Labels are passed as keyword arguments.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.meta = {}
+        self.values = defaultdict(dict)
+
+
+    def declare(self, name, kind, text, buckets=None):
+        self.meta[name] = {
+            "kind": kind,
+            "text": text,
+            "buckets": buckets,
+        }
+
+    def counter(self, name, text):
+        self.declare(name, "counter", text)
+
+    def gauge(self, name, text):
+        self.declare(name, "gauge", text)
+
+    def histogram(self, name, text, buckets):
+        self.declare(name, "histogram", text, buckets=tuple(sorted(buckets)))
+
+
+    def inc(self, name, value=1, **labels):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values[name]
+            series[labels] = series.get(labels, 0) + value
+
+
+    def set(self, name, value, **labels):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][labels] = value
+
+
+    def observe(self, name, value, **labels):
+        buckets = self.meta[name]["buckets"]
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values[name]
+            if labels not in series:
+                series[labels] = {
+                    "counts": [0] * (len(buckets) + 1),
+                    "sum": 0,
+                    "count": 0,
+                }
+            data = series[labels]
+            data["counts"][bisect.bisect_left(buckets, value)] += 1
+            data["sum"] += value
+            data["count"] += 1
+
+
+    def render(self) -> str:
+        lines = []
+
+        with self.lock:
+            for name, meta in sorted(self.meta.items()):
+                lines.append(f"# HELP {name} {meta['text']}")
+                lines.append(f"# TYPE {name} {meta['kind']}")
+
+                for labels, value in sorted(self.values[name].items()):
+                    if meta["kind"] != "histogram":
+                        lines.append(
+                            f"{name}{format_labels(labels)} {format_number(value)}")
+                        continue
+
+                    total = 0
+                    for le, count in zip(
+                            meta["buckets"] + (float("inf"), ), value["counts"]):
+                        total += count
+                        bucket_labels = labels + (("le", format_number(le)), )
+                        lines.append(
+                            f"{name}_bucket{format_labels(bucket_labels)} {total}")
+                    lines.append(
+                        f"{name}_sum{format_labels(labels)} {format_number(value['sum'])}")
+                    lines.append(
+                        f"{name}_count{format_labels(labels)} {value['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(self.application.metrics.render())
@@ -0,0 +1,273 @@
+"""
+Pre-warm the cache by calling every `cache_and_profile` function
+for a set of filter states.
+"""
+
+import json
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import itertools
+from pathlib import Path
+from typing import Union, Iterable, Callable
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from tornado.httputil import HTTPServerRequest
+
+from caatdash.web import \
+    FilterPartition, \
+    FilterGroupedSet, \
+    cache_and_profile
+
+
+
+LOG = logging.getLogger("caatdash_warm")
+
+
+
+class WarmConnection():
+    """
+    Stand-in for the HTTP connection of a request made outside the server.
+    """
+
+    def set_close_callback(self, callback):
+        pass
+
+
+
+def filter_variations(filter_, items=None):
+    """
+    Return a list of non-default request values for `filter_`.
+
+    Partitions vary between their default and all values, and optionally
+    each single item. Grouped sets vary over each group, and optionally
+    each single item.
+    """
+
+    default = filter_.default_request_args[filter_.key]
+    values = []
+
+    if isinstance(filter_, FilterPartition):
+        values.append(None)
+        if items:
+            values += [{v["key"]} for v in filter_.items]
+
+    elif isinstance(filter_, FilterGroupedSet):
+        if filter_.groups:
+            values += [{v} for v in filter_.groups]
+        if items and filter_.items:
+            values += [{v} for v in filter_.items]
+
+    return [v for v in values if v != default]
+
+
+
+def filter_states(filters, depth=1, items=None, limit=None) -> Iterable[dict]:
+    """
+    Yield request args for the default state, then for states with up
+    to `depth` filters changed from their default value.
+    """
+
+    default_args = {}
+    for filter_ in filters.values():
+        default_args.update(filter_.default_request_args)
+
+    variations = [
+        (filter_.key, filter_variations(filter_, items=items))
+        for filter_ in filters.values()
+    ]
+    variations = [v for v in variations if v[1]]
+
+    count = 0
+
+    def states():
+        yield dict(default_args)
+        for n in range(1, depth + 1):
+            for combination in itertools.combinations(variations, n):
+                keys = [v[0] for v in combination]
+                for values in itertools.product(*[v[1] for v in combination]):
+                    args = dict(default_args)
+                    args.update(zip(keys, values))
+                    yield args
+
+    for args in states():
+        if limit is not None and count >= limit:
+            return
+        count += 1
+        yield args
+
+
+
+def state_id(request_args) -> str:
+    return json.dumps(
+        {k: sorted(v) if isinstance(v, (set, frozenset)) else v
+         for k, v in request_args.items()},
+        sort_keys=True, separators=(",", ":"))
+
+
+
+def make_handler(application, handler_class, filters, request_args, force=None):
+    """
+    Create a handler for a GET request to the canonical URL of `request_args`.
+    """
+
+    query_parts = []
+    for filter_ in filters.values():
+        query_parts += filter_.query_params(request_args)
+    if force:
+        query_parts.append("cache=false")
+
+    uri = "/"
+    if query_parts:
+        uri += "?" + "&".join(query_parts)
+
+    request = HTTPServerRequest(method="GET", uri=uri, connection=WarmConnection())
+    return handler_class(application, request)
+
+
+
+def build_filter_dict(filters, request_args, handler):
+    filter_dict = {}
+    for filter_ in filters.values():
+        (filter_dict_, _request_labels, errors) = filter_.filter_dict(
+            request_args, handler=handler)
+        if errors:
+            raise Exception(" ".join([v["message"] for v in errors]))
+        filter_dict.update(filter_dict_)
+
+    return filter_dict
+
+
+
+def warm_cache(
+        application,
+        handler_class,
+        functions: Union[Iterable[Callable], None] = None,
+        depth: int = 1,
+        items: Union[bool, None] = None,
+        limit: Union[int, None] = None,
+        parallel: int = 4,
+        state_path: Union[Path, None] = None,
+        force: Union[bool, None] = None,
+        report: float = 10,
+) -> dict:
+    """
+    Call each of `functions` (by default, every function decorated with
+    `cache_and_profile` or `cache_and_profile_async`) for each filter state
+    from `filter_states`, with at most `parallel` calls at once.
+
+    Coroutine functions run on an event loop in a separate thread.
+
+    Completed calls are appended to `state_path`, if supplied, and skipped
+    when run again, so an interrupted run can be resumed.
+
+    If `force` is truthy, values are recomputed even if they are cached.
+
+    Progress is logged every `report` seconds.
+    """
+
+    filters = application.filters
+
+    if functions is None:
+        functions = cache_and_profile.registry
+    functions = list(functions)
+
+    done = set()
+    if state_path and state_path.exists():
+        done = set(state_path.read_text().splitlines())
+
+    tasks = []
+    for request_args in filter_states(filters, depth=depth, items=items, limit=limit):
+        state = state_id(request_args)
+        for function in functions:
+            task_id = f"{function.cache_and_profile.key} {state}"
+            if task_id in done:
+                continue
+            tasks.append((task_id, request_args, function))
+
+    stats = {
+        "total": len(tasks),
+        "skipped": len(done),
+        "done": 0,
+        "failed": 0,
+    }
+    lock = threading.Lock()
+    state_fp = state_path.open("a") if state_path else None
+
+    loop = None
+    if any(inspect.iscoroutinefunction(v) for v in functions):
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+        loop_thread.start()
+
+
+    def run(task_id, request_args, function):
+        handler = make_handler(
+            application, handler_class, filters, request_args, force=force)
+        filter_dict = build_filter_dict(filters, request_args, handler)
+        if inspect.iscoroutinefunction(function):
+            asyncio.run_coroutine_threadsafe(function(handler, filter_dict), loop).result()
+        else:
+            function(handler, filter_dict)
+
+        if state_fp:
+            with lock:
+                state_fp.write(task_id + "\n")
+                state_fp.flush()
+
+
+    start = time.monotonic()
+    last_report = start
+
+    def log_progress():
+        duration = time.monotonic() - start
+        rate = stats["done"] / duration if duration else 0
+        LOG.info(
+            "%d/%d done, %d failed, %.1f/s",
+            stats["done"], stats["total"], stats["failed"], rate)
+
+
+    LOG.info("%d calls to make, %d already done.", stats["total"], stats["skipped"])
+
+    try:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            task_iter = iter(tasks)
+            pending = {}
+
+            while True:
+                while len(pending) < parallel:
+                    task = next(task_iter, None)
+                    if task is None:
+                        break
+                    pending[executor.submit(run, *task)] = task
+
+                if not pending:
+                    break
+
+                (complete, _not_done) = wait(
+                    pending, timeout=report, return_when=FIRST_COMPLETED)
+
+                for future in complete:
+                    (task_id, _request_args, _function) = pending.pop(future)
+                    stats["done"] += 1
+                    error = future.exception()
+                    if error is not None:
+                        stats["failed"] += 1
+                        LOG.error("Failed: %s: %s", task_id, repr(error))
+
+                if time.monotonic() - last_report >= report:
+                    last_report = time.monotonic()
+                    log_progress()
+    finally:
+        if state_fp:
+            state_fp.close()
+        if loop:
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join()
+            loop.close()
+
+    log_progress()
+
+    return stats
@@ -47,6 +47,7 @@ setuptools.setup(
     ],
     scripts=[
         "scripts/po2json",
+        "scripts/caatdash-warm",
     ],
     python_requires='>=3',
     setup_requires=[],
@@ -333,6 +333,7 @@
   function CaatDashFilterSet (app, control, filterSpec, setCallback) {
     var filter = this;
     var placeholder;
+    var specData = _.get(app.data, ["filters", filterSpec.key]);
 
     CaatDashFilter.call(this, app, control, filterSpec, setCallback);
 
@@ -348,6 +349,14 @@
       filter.staticSource = filterSpec.staticSource(app, filterSpec);
       filter.itemLabel = this.itemLabelStatic;
       filter.autocompleteSource = this.autocompleteSourceStatic;
+    } else if (!_.isFunction(filterSpec.search) && !_.isNil(specData)) {
+      // Groups and items loaded from `filterSpecUrl`.
+      filter.staticSource = _.concat(specData.groups || [], specData.items || []);
+      filter.itemLabel = this.itemLabelStatic;
+      filter.autocompleteSource = this.autocompleteSourceStatic;
+      if (_.isNil(filter.allowSearchText)) {
+        filter.allowSearchText = specData.allowSearchText;
+      }
     } else {
       filter.itemLabel = filterSpec.itemLabel;
       filter.autocompleteSource = function (request, callback) {
@@ -355,6 +364,11 @@
       };
     }
 
+    if (filterSpec.autocompleteUrl) {
+      filter.autocompleteUrl = filterSpec.autocompleteUrl;
+      filter.autocompleteSource = this.autocompleteSourceRemote;
+    }
+
     if (!_.isNil(_.get(filter, "text.placeholderNames"))) {
       placeholder = _.map(filter.text.placeholderNames, function (v) {
         if (_.get(filterSpec, "i18nContext.label")) {
@@ -463,6 +477,28 @@
       callback(result);
     },
 
+    autocompleteSourceRemote: function (request, callback) {
+      var filter = this;
+      var app = filter.app;
+
+      var data = {
+        term: request.term,
+        limit: 16
+      };
+      if (!_.isEmpty(request.value)) {
+        data.exclude = _.map(request.value, "value").join(",");
+      }
+      if (!_.isNil(app.lang)) {
+        data.lang = app.lang;
+      }
+
+      $.getJSON(filter.autocompleteUrl, data).done(function (result) {
+        callback(result);
+      }).fail(function () {
+        callback([]);
+      });
+    },
+
     addItem: function (item) {
       var filter = this;
 
@@ -677,7 +713,8 @@
     CaatDashFilter.call(this, app, control, filterSpec, setCallback);
 
     filter.defaultValue = undefined;
-    filter.items = filterSpec.items;
+    // Fall back to items loaded from `filterSpecUrl`.
+    filter.items = filterSpec.items || _.get(app.data, ["filters", filterSpec.key, "items"]);
     filter.allValue = filterSpec.allValue;
     filter.defaultValue = filterSpec.defaultValue;
 
@@ -927,6 +964,12 @@
     }
 
     this.setLanguage();
+
+    // Filter specs served separately from the page, so they can be
+    // cached by the browser. Pass `filterSpecUrl` from the handler's
+    // `filter_spec_url(lang)`. `run` waits for them, so filters are
+    // created with their groups and items in `data.filters`.
+    self.dataReady = this.loadFilterSpecs(options.filterSpecUrl);
   }
 
   _.extend(CaatDash.prototype, {
@@ -1257,6 +1300,30 @@
 
     // AJAX functions
 
+    loadFilterSpecs: function (url) {
+      // Return a promise of `data`, with filter specs from `url`,
+      // if supplied, as `data.filters`.
+
+      var self = this;
+
+      if (_.isNil(url)) {
+        return $.Deferred().resolve(self.data).promise();
+      }
+
+      return $.ajax({
+        url: url,
+        dataType: "json",
+        cache: true
+      }).then(function (filters) {
+        self.data = _.extend({}, self.data, {
+          filters: filters
+        });
+        return self.data;
+      }, function () {
+        console.error("CaatDash: Failed to load filter specs from `" + url + "`.");
+      });
+    },
+
     ajaxBuffer: function (options) {
       // Create an Ajax Buffer with logging.
 
@@ -1799,8 +1866,11 @@
           contentState = window.history.state;
         }
 
-        self.initScrollEvent();
-        self.route(firma.getState(contentState));
+        // Filters are created when routing.
+        self.dataReady.always(function () {
+          self.initScrollEvent();
+          self.route(firma.getState(contentState));
+        });
       });
     }
   });
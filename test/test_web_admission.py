@@ -0,0 +1,48 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("firma")
+
+from caatdash.web.admission import AdmissionControl, AdmissionRejected
+
+
+
+def admit_seconds(admission, key):
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        with admission.admit(key):
+            pass
+    return time.monotonic() - start
+
+
+
+def test_admit_event_loop():
+    admission = AdmissionControl(limit=1, wait=0.5)
+    acquired = admission.acquire("test")
+
+    async def main():
+        return admit_seconds(admission, "test")
+
+    try:
+        assert asyncio.run(main()) < 0.1
+    finally:
+        admission.release("test", acquired)
+
+
+
+def test_admit_thread():
+    admission = AdmissionControl(limit=1, wait=0.5)
+    acquired = admission.acquire("test")
+    seconds = []
+
+    thread = threading.Thread(target=lambda: seconds.append(admit_seconds(admission, "test")))
+    try:
+        thread.start()
+        thread.join()
+    finally:
+        admission.release("test", acquired)
+
+    assert seconds[0] >= 0.5
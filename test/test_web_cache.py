@@ -0,0 +1,338 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip("firma")
+
+from tornado.testing import AsyncHTTPTestCase
+from tornado.util import ObjectDict
+
+from caatdash.web import \
+    BaseHandler, \
+    CaatDashApplication, \
+    RESULT_PARTIAL, \
+    cache_and_profile, \
+    cache_and_profile_async, \
+    cache_response, \
+    merge_sum, \
+    merge_top_k, \
+    post_limit_items
+
+
+
+class MemoryCache():
+    """
+    In-memory stand-in for the shared cache backend.
+    """
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, key, accept_old=False):
+        item = self.items.get(key, None)
+        if item is None:
+            return None
+        (value, expires, expired) = item
+        if (expired or expires < time.time()) and not accept_old:
+            return None
+        return value
+
+    def set_item(self, key, value, ttl=None, expired=False):
+        self.items[key] = (value, time.time() + ttl, expired)
+        return True
+
+
+
+def make_application(handlers, **settings):
+    return CaatDashApplication(
+        handlers, ObjectDict(lang=None), cache=MemoryCache(), **settings)
+
+
+
+class CacheHandler(BaseHandler):
+    def profile_start(self, key):
+        pass
+
+    def profile_end(self, key):
+        pass
+
+
+
+@post_limit_items
+@cache_and_profile("test-rank-budget", budget=0.5)
+def rank_budget(_handler, _filter_dict):
+    return {
+        "items": list(range(100)),
+    }
+
+
+
+class RankBudgetHandler(CacheHandler):
+    def get(self):
+        self.write(self.dump_json(rank_budget(self, {}, post_limit=10)))
+
+
+
+class TestPostLimitBudget(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_application([("/rank", RankBudgetHandler)])
+
+    def test_exhausted(self):
+        response = self.fetch("/rank?budget=1")
+        assert response.code == 200
+        assert json.loads(response.body) == RESULT_PARTIAL
+
+    def test_limited(self):
+        response = self.fetch("/rank")
+        assert response.code == 200
+        assert json.loads(response.body)["items"] == list(range(10))
+
+
+
+class RankResponseHandler(CacheHandler):
+    def prepare(self):
+        self.filters = {}
+        self.request_args = {}
+
+    @cache_response()
+    def get(self):
+        self.write(self.dump_json(rank_budget(self, {})))
+
+
+
+class RankEtagHandler(RankResponseHandler):
+    @cache_response()
+    def get(self):
+        if self.check_etag_canonical(max_age=60):
+            return
+        self.write(self.dump_json(rank_budget(self, {})))
+
+
+
+class TestResponseHeaders(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_application([("/rank", RankEtagHandler)])
+
+    def test_headers(self):
+        fresh = self.fetch("/rank")
+        cached = self.fetch("/rank")
+
+        for name in ("ETag", "Cache-Control"):
+            assert cached.headers[name] == fresh.headers[name]
+        assert cached.body == fresh.body
+
+        response = self.fetch("/rank", headers={"If-None-Match": fresh.headers["ETag"]})
+        assert response.code == 304
+
+
+
+class TestResponseDegraded(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_application([("/rank", RankResponseHandler)])
+
+    def response_keys(self):
+        return [v for v in self._app.settings.cache.items if v.startswith("response-url:")]
+
+    def test_budget(self):
+        response = self.fetch("/rank?budget=1")
+        assert json.loads(response.body) == RESULT_PARTIAL
+        assert not self.response_keys()
+
+        response = self.fetch("/rank")
+        assert json.loads(response.body)["items"] == list(range(100))
+        assert len(self.response_keys()) == 1
+
+    def test_latency_budget(self):
+        self._app.settings.options.latency_budget = 1
+        response = self.fetch("/rank")
+        assert json.loads(response.body) == RESULT_PARTIAL
+        assert not self.response_keys()
+
+    def test_pretty(self):
+        response = self.fetch("/rank?pretty=true")
+        assert b"\n" in response.body
+        assert not self.response_keys()
+
+        response = self.fetch("/rank")
+        assert b"\n" not in response.body
+
+
+
+def test_merge_sum_unmergeable():
+    with pytest.raises(ValueError):
+        merge_sum([[{"value": 1}], [{"value": 2}]])
+    with pytest.raises(ValueError):
+        merge_sum([["a"], ["b"]])
+    with pytest.raises(ValueError):
+        merge_sum([1, {"value": 1}])
+
+
+
+def test_merge_top_k():
+    values = [
+        {"count": 2, "items": [{"key": "a", "value": 1}, {"key": "b", "value": 2}]},
+        {"count": 2, "items": [{"key": "b", "value": 3}, {"key": "c", "value": 4}]},
+    ]
+
+    result = merge_top_k(values)
+
+    assert result["count"] == 3
+    assert result["items"] == [
+        {"key": "b", "value": 5},
+        {"key": "c", "value": 4},
+        {"key": "a", "value": 1},
+    ]
+    assert [v["key"] for v in values[0]["items"]] == ["a", "b"]
+
+
+
+@cache_and_profile_async("test-count-decomposed", decompose="country")
+def count_decomposed(_handler, filter_dict):
+    return {
+        "count": len(filter_dict["country"]),
+    }
+
+
+
+class CountDecomposedHandler(CacheHandler):
+    async def get(self):
+        countries = set(self.get_argument("country").split(","))
+        result = await count_decomposed(self, {"country": countries})
+        self.write(self.dump_json(result))
+
+
+
+class TestDecomposeAsync(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_application([("/count", CountDecomposedHandler)])
+
+    def atom_keys(self):
+        return [v for v in self._app.settings.cache.items if "test-count-decomposed" in v]
+
+    def test_decompose(self):
+        response = self.fetch("/count?country=france,germany,italy")
+        assert json.loads(response.body) == {"count": 3}
+        assert len(self.atom_keys()) == 3
+
+        response = self.fetch("/count?country=france,spain")
+        assert json.loads(response.body) == {"count": 2}
+        assert len(self.atom_keys()) == 4
+
+
+
+@cache_and_profile("test-key")
+def keyed(_handler, _filter_dict):
+    return None
+
+
+
+class LegacyKeyHandler(CacheHandler):
+    def cache_key_filtered(self, key, filter_dict, **_kwargs):
+        return f"{key}:legacy:{','.join(sorted(filter_dict))}"
+
+    def get(self):
+        self.write(self.dump_json([
+            keyed.cache_and_profile.cache_key(self, filter_dict)
+            for filter_dict in ({}, {"country": None})
+        ]))
+
+
+
+class TestCacheKeyLegacy(AsyncHTTPTestCase):
+    legacy = False
+
+    def get_app(self):
+        return make_application(
+            [("/key", LegacyKeyHandler)], cache_key_legacy=self.legacy)
+
+    def test_cache_key(self):
+        keys = json.loads(self.fetch("/key").body)
+        if self.legacy:
+            assert keys == ["test-key:legacy:", "test-key:legacy:country"]
+        else:
+            assert keys[0] == keys[1]
+            assert "legacy" not in keys[0]
+
+
+
+class TestCacheKeyLegacyEnabled(TestCacheKeyLegacy):
+    legacy = True
+
+
+
+RANK_TOP_K_ITEMS = {
+    "empty": [],
+    "none": None,
+    "many": list(range(20)),
+}
+
+
+
+@cache_and_profile("test-rank-top-k", top_k=True)
+def rank_top_k(_handler, filter_dict, limit=None):
+    items = RANK_TOP_K_ITEMS[filter_dict["kind"]]
+    return {
+        "items": items[:limit] if items and limit is not None else items,
+    }
+
+
+
+class RankTopKHandler(CacheHandler):
+    def get(self):
+        filter_dict = {"kind": self.get_argument("kind")}
+        self.write(self.dump_json(rank_top_k(self, filter_dict, post_limit=10)))
+
+
+
+class TestTopKEmpty(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_application([("/rank", RankTopKHandler)])
+
+    def test_empty(self):
+        for kind in ("empty", "none"):
+            # Computed, then cached.
+            for _ in range(2):
+                response = self.fetch(f"/rank?kind={kind}")
+                assert response.code == 200
+                assert json.loads(response.body) == {"items": RANK_TOP_K_ITEMS[kind]}
+
+    def test_limited(self):
+        response = self.fetch("/rank?kind=many")
+        assert json.loads(response.body) == {"items": list(range(10))}
+
+
+
+class PrefetchHandler(CacheHandler):
+    def get(self):
+        self.cache_prefetch([(rank_budget, {}, {"post_limit": 10})])
+        gets = self.settings["cache"].gets
+        result = rank_budget(self, {}, post_limit=10)
+        self.write(self.dump_json({
+            "items": result["items"],
+            "gets": self.settings["cache"].gets - gets,
+        }))
+
+
+
+class TestPrefetchPostLimit(AsyncHTTPTestCase):
+    def get_app(self):
+        cache = MemoryCache()
+        cache.gets = 0
+        get_item = cache.get_item
+
+        def get_item_counted(*args, **kwargs):
+            cache.gets += 1
+            return get_item(*args, **kwargs)
+
+        cache.get_item = get_item_counted
+
+        return CaatDashApplication(
+            [("/prefetch", PrefetchHandler)], ObjectDict(lang=None), cache=cache)
+
+    def test_prefetch(self):
+        # Computed, then cached. Neither call reads the cache again.
+        for _ in range(2):
+            response = self.fetch("/prefetch")
+            assert response.code == 200
+            assert json.loads(response.body) == {"items": list(range(10)), "gets": 0}
@@ -0,0 +1,154 @@
+import pytest
+
+pytest.importorskip("firma")
+
+from tornado.testing import AsyncHTTPTestCase
+from tornado.util import ObjectDict
+
+from caatdash.web import \
+    BaseHandler, \
+    CaatDashApplication, \
+    FilterBoolean, \
+    FilterGroupedSet, \
+    FilterPartition, \
+    FilterPlan
+
+
+
+def make_filters(preverify=None):
+    filters = [
+        FilterGroupedSet({
+            "key": "country",
+            "items": ["france", "germany", "italy"],
+            "groups": {
+                "eu": {
+                    "items": ["france", "germany"],
+                },
+            },
+            "preverify": preverify,
+        }),
+        FilterPartition({
+            "key": "rating",
+            "items": [
+                {"key": "ml1", "defaultValue": True},
+                {"key": "ml2", "defaultValue": True},
+                {"key": "ml3", "defaultValue": False},
+            ],
+        }),
+        FilterBoolean({
+            "key": "licensed",
+        }),
+    ]
+
+    return {v.key: v for v in filters}
+
+
+
+def evaluate_filters(filters, raw_params, **kwargs):
+    request_args = {}
+    filter_dict = {}
+    for filter_ in filters.values():
+        (args, _redirect) = filter_.request_args(raw_params, **kwargs)
+        request_args.update(args)
+        filter_dict.update(filter_.filter_dict(args)[0])
+
+    query_parts = []
+    for filter_ in filters.values():
+        query_parts += filter_.query_params(request_args)
+
+    return (request_args, filter_dict, query_parts)
+
+
+
+@pytest.mark.parametrize("raw_params", [
+    {},
+    {"country": ["eu,italy"]},
+    {"rating": ["ml3"]},
+    {"rating": ["all"], "licensed": ["true"]},
+    {"country": ["germany"], "rating": ["ml1,ml3"], "licensed": ["0"]},
+])
+@pytest.mark.parametrize("kwargs", [{}, {"default_all": True}])
+def test_plan_evaluate(raw_params, kwargs):
+    filters = make_filters()
+    plan = FilterPlan(filters)
+
+    evaluation = plan.evaluate(raw_params, **kwargs)
+    query_parts = plan.query_params(evaluation.request_args)
+
+    assert (evaluation.request_args, evaluation.filter_dict, query_parts) == \
+        evaluate_filters(filters, raw_params, **kwargs)
+
+
+
+def test_plan_shared_values():
+    plan = FilterPlan(make_filters())
+
+    plan.evaluate({}).filter_dict["country"].add("spain")
+
+    assert plan.evaluate({}).filter_dict["country"] == set()
+
+
+
+def test_plan_preverify():
+    def preverify(args, raw_params):
+        if "licensed" in raw_params:
+            args["country"] = {"france"}
+        return False
+
+    filters = make_filters(preverify=preverify)
+    plan = FilterPlan(filters)
+
+    assert plan.evaluate({"licensed": ["1"]}).filter_dict["country"] == {"france"}
+
+
+
+class FilterPartitionSince(FilterPartition):
+    def request_args(self, raw_params, **kwargs):
+        if "since" in raw_params:
+            return ({self.key: frozenset(["new"])}, False)
+        return super().request_args(raw_params, **kwargs)
+
+
+
+def test_plan_subclass():
+    filter_ = FilterPartitionSince({
+        "key": "age",
+        "items": [
+            {"key": "old", "defaultValue": True},
+            {"key": "new", "defaultValue": False},
+        ],
+    })
+    plan = FilterPlan({"age": filter_})
+
+    assert not filter_.default_static
+    assert plan.evaluate({"since": ["1"]}).request_args["age"] == {"new"}
+
+
+
+class SpecUrlHandler(BaseHandler):
+    def get(self):
+        self.write(self.filter_spec_url())
+
+
+
+class TestFilterSpecs(AsyncHTTPTestCase):
+    def get_app(self):
+        app = CaatDashApplication(
+            [("/spec-url", SpecUrlHandler)], ObjectDict(lang=None),
+            cache=None, filter_spec_path="/filter-specs")
+        app.filters.update(make_filters())
+        app.compile_filters()
+        return app
+
+    def test_etag(self):
+        url = self.fetch("/spec-url").body.decode()
+        assert url.endswith(".json")
+
+        etags = set()
+        for coding in ("gzip", "identity"):
+            response = self.fetch(
+                url, headers={"Accept-Encoding": coding}, decompress_response=False)
+            assert response.code == 200
+            etags.add(response.headers["ETag"])
+
+        assert len(etags) == 2
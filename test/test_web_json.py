@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+pytest.importorskip("firma")
+
+from tornado.testing import AsyncHTTPTestCase
+from tornado.util import ObjectDict
+
+from caatdash.web import BaseHandler, CaatDashApplication, json_length
+
+from test_web_cache import MemoryCache
+
+
+
+def test_json_length():
+    assert json_length(None) == 0
+    assert json_length([1, 2]) == 2
+    assert json_length({"items": [{"a": 1}, {"b": 2}], "count": 2}) == 4
+
+
+
+class StreamHandler(BaseHandler):
+    async def get(self):
+        n = int(self.get_argument("n"))
+        await self.write_json_stream({"items": list(range(n))}, min_values=100)
+
+
+
+class TestWriteJsonStream(AsyncHTTPTestCase):
+    def get_app(self):
+        return CaatDashApplication(
+            [("/stream", StreamHandler)], ObjectDict(lang=None), cache=None)
+
+    def test_compact(self):
+        for n in (10, 1000):
+            response = self.fetch(f"/stream?n={n}")
+            assert response.body == json.dumps(
+                {"items": list(range(n))}, separators=(",", ":")).encode()
+
+
+
+class PrecompressedHandler(BaseHandler):
+    async def get(self):
+        await self.write_json_precompressed("test", lambda: {"items": list(range(100))})
+
+
+
+class TestWriteJsonPrecompressed(AsyncHTTPTestCase):
+    def get_app(self):
+        return CaatDashApplication(
+            [("/data", PrecompressedHandler)], ObjectDict(lang=None), cache=MemoryCache())
+
+    def test_etag(self):
+        etags = set()
+        for coding in ("gzip", "identity", "gzip"):
+            response = self.fetch(
+                "/data", headers={"Accept-Encoding": coding}, decompress_response=False)
+            assert response.code == 200
+            assert response.headers.get("Content-Encoding", "identity") == coding
+            etags.add(response.headers["ETag"])
+
+        assert len(etags) == 2